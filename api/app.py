@@ -1,9 +1,39 @@
-from fastapi import FastAPI, HTTPException, Response
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import os, re
-from api.http_sedapal import SedapalHTTP  # asegúrate de este import
+from pydantic import BaseModel
+from typing import List, Optional, Union
+from contextlib import asynccontextmanager
+import os, re, asyncio, time
+from api.http_sedapal import AsyncSedapalHTTP, listing_age, listing_stale  # asegúrate de este import
+from api.recibo import as_dicts
+from api import jsonfast
+from api.compression import CompressionMiddleware, acached_body, encoded_etag, base_etag, negotiate
+from api.cache import start_sweeper, all_stats
+from api.zip_stream import zip_stream
+from api.resilience import CircuitOpenError, BREAKER_RESET
+from api.metrics import REGISTRY, REQUEST_SECONDS, CONTENT_TYPE
 
-app = FastAPI(title="SEDAPAL Backend")
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializado con api.jsonfast (orjson/msgspec si están)."""
+
+    def render(self, content) -> bytes:
+        return jsonfast.dumps(content)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_sweeper(float(os.getenv("SEDAPAL_CACHE_SWEEP", "60")))
+    client.tokens.start()
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+app = FastAPI(title="SEDAPAL Backend", default_response_class=FastJSONResponse, lifespan=lifespan)
+
+BATCH_MAX = int(os.getenv("SEDAPAL_BATCH_MAX", "100"))
+BATCH_CONCURRENCY = max(1, int(os.getenv("SEDAPAL_BATCH_CONCURRENCY", "8")))
+ZIP_CONCURRENCY = max(1, int(os.getenv("SEDAPAL_ZIP_CONCURRENCY", "4")))
 
 origins = [
     "http://localhost:8080",
@@ -14,11 +44,51 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=False,
-    allow_methods=["GET", "HEAD", "OPTIONS"],
+    allow_methods=["GET", "HEAD", "POST", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["Age", "ETag", "X-Sedapal-Stale"],
 )
 
-client = SedapalHTTP()
+# comprime lo dinámico; los listados cacheados ya llegan comprimidos y pasan de largo
+app.add_middleware(CompressionMiddleware)
+
+client = AsyncSedapalHTTP()
+
+@app.middleware("http")
+async def _request_metrics(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # plantilla de la ruta (/api/pdf/{nis}/{recibo}), no la URL: acota las series
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, method=request.method,
+                                route=getattr(route, "path", "unmatched"), status=status)
+
+@REGISTRY.collector
+def _client_samples():
+    tok = client.tokens.stats()
+    yield "sedapal_logins_total", "counter", "Logins hechos por este worker", {}, tok["logins"]
+    yield "sedapal_token_adopted_total", "counter", "Tokens tomados de otro worker", {}, tok["adopted"]
+    yield "sedapal_auth_retries_total", "counter", "Reintentos tras 401/403", {}, client.auth_retries
+    yield "sedapal_listing_revalidations_total", "counter", "Refrescos de listados en segundo plano", {}, client.revalidations
+    yield "sedapal_listing_stale_served_total", "counter", "Listados viejos servidos porque SEDAPAL falló", {}, client.stale_served
+    for outcome, n in client.prefetch.items():
+        yield "sedapal_pdf_prefetch_total", "counter", "PDFs precargados por resultado", {"outcome": outcome}, n
+    cb = client.cache_backend.stats()
+    for kind in ("hits", "misses", "errors"):
+        yield "sedapal_cache_backend_ops_total", "counter", "Operaciones contra el backend de caché compartido", {"backend": cb["backend"], "result": kind}, cb[kind]
+    sf = client.flights.stats()
+    yield "sedapal_singleflight_shared_total", "counter", "Peticiones que esperaron una llamada en curso", {}, sf["shared"]
+    for ep, st in client.upstream.stats().items():
+        labels = {"endpoint": ep}
+        yield "sedapal_upstream_limit", "gauge", "Concurrencia permitida por el limitador AIMD", labels, st["limit"]
+        yield "sedapal_upstream_in_flight", "gauge", "Llamadas en curso", labels, st["in_flight"]
+        yield "sedapal_upstream_breaker_open", "gauge", "1 si el breaker no está cerrado", labels, int(st["breaker"]["state"] != "closed")
+        yield "sedapal_upstream_breaker_trips_total", "counter", "Veces que se abrió el breaker", labels, st["breaker"]["trips"]
 
 def _clean_nis(nis_raw: str) -> int:
     nis_num = re.sub(r"\D+", "", str(nis_raw))  # deja solo dígitos
@@ -26,6 +96,28 @@ def _clean_nis(nis_raw: str) -> int:
         raise HTTPException(status_code=422, detail="NIS inválido")
     return int(nis_num)
 
+def _not_modified(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    # comparación débil (RFC 9110): vale la ETag de cualquier variante comprimida
+    tags = [base_etag(t) for t in inm.split(",")]
+    return "*" in tags or base_etag(etag) in tags
+
+@app.exception_handler(CircuitOpenError)
+async def _circuit_open(request: Request, exc: CircuitOpenError):
+    return FastJSONResponse({"detail": str(exc)}, status_code=503,
+                        headers={"Retry-After": str(int(BREAKER_RESET))})
+
+def _listing_json(entry: dict) -> bytes:
+    items = as_dicts(entry["items"])
+    return jsonfast.dumps({"ok": True, "total": len(items), "items": items, "source": "SEDAPAL_HTTP"})
+
+async def _prepend(first: bytes, rest):
+    yield first
+    async for chunk in rest:
+        yield chunk
+
 @app.get("/api/test")
 def test():
     return {
@@ -33,35 +125,180 @@ def test():
         "mode": "HTTP-DIRECT",
         "page_size": int(os.getenv("SEDAPAL_PAGE_SIZE", "42")),
         "target_max": int(os.getenv("TARGET_MAX_RECIBOS", "30")),
+        "caches": all_stats(),
+        "cache_backend": client.cache_backend.stats(),
+        "single_flight": client.flights.stats(),
+        "token": dict(client.tokens.stats(), auth_retries=client.auth_retries),
+        "pdf_store": client.pdf_store.stats() if client.pdf_store else None,
+        "recibos_store": client.store.stats() if client.store else None,
+        "upstream": client.upstream.stats(),
+        "listings": {"revalidations": client.revalidations, "stale_served": client.stale_served},
+        "prefetch": client.prefetch_stats(),
     }
 
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.get("/api/recibos/{nis}")
-def recibos(nis: str):
+async def recibos(nis: str, request: Request):
     try:
         nis_i = _clean_nis(nis)
-        items = client.fetch_all_recibos(nis_i)
-        return {"ok": True, "total": len(items), "items": items, "source": "SEDAPAL_HTTP"}
-    except HTTPException:
+        entry = await client.fetch_recibos_entry(nis_i)
+        accept_encoding = request.headers.get("accept-encoding")
+        # la antigüedad va en cabeceras para que el cuerpo (y su ETag) no cambie mientras se revalida;
+        # la ETag sale del encoding negociado, así el 304 se contesta sin serializar ni comprimir nada
+        headers = {"ETag": encoded_etag(entry["etag"], negotiate(accept_encoding)), "Cache-Control": "no-cache",
+                   "Age": str(listing_age(entry)), "Vary": "Accept-Encoding"}
+        if listing_stale(entry):
+            headers["X-Sedapal-Stale"] = "1"
+        # lo siguiente suele ser abrir el recibo más nuevo: se calienta su PDF
+        client.prefetch_pdfs(nis_i, entry["items"])
+        if _not_modified(request, entry["etag"]):
+            return Response(status_code=304, headers=headers)
+        # el cuerpo de cada variante queda memoizado en la entrada: se comprime una sola vez
+        body, encoding = await acached_body(entry, lambda: _listing_json(entry), accept_encoding)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type="application/json", headers=headers)
+    except (HTTPException, CircuitOpenError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/recibos/{nis}/historial")
+async def historial(nis: str, desde: Optional[str] = None, hasta: Optional[str] = None, pendientes: bool = False):
+    nis_i = _clean_nis(nis)
+    if not client.store:
+        raise HTTPException(status_code=503, detail="Historial no disponible")
+    items = await client.query_recibos(nis_i, desde, hasta, pendientes)
+    return {"ok": True, "total": len(items), "items": items, "source": "SQLITE"}
+
+class BatchRequest(BaseModel):
+    nis: List[Union[int, str]]  # el back office suele mandar números
+
+@app.post("/api/recibos/batch")
+async def recibos_batch(req: BatchRequest):
+    if not req.nis:
+        raise HTTPException(status_code=422, detail="Lista de NIS vacía")
+    if len(req.nis) > BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {BATCH_MAX} NIS por consulta")
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(raw: Union[int, str]) -> dict:
+        try:
+            nis_i = _clean_nis(raw)
+        except HTTPException as e:
+            return {"nis": raw, "ok": False, "error": e.detail}
+        try:
+            async with sem:
+                entry = await client.fetch_recibos_entry(nis_i)
+            items = as_dicts(entry["items"])
+            return {"nis": nis_i, "ok": True, "total": len(items), "items": items,
+                    "age": listing_age(entry), "stale": listing_stale(entry)}
+        except Exception as e:
+            return {"nis": nis_i, "ok": False, "error": str(e)}
+
+    results = await asyncio.gather(*(one(n) for n in req.nis))
+    return {
+        "ok": True,
+        "total": len(results),
+        "errors": sum(1 for r in results if not r["ok"]),
+        "results": results,
+        "source": "SEDAPAL_HTTP",
+    }
+
 @app.get("/api/pdf/{nis}/{recibo}")
-def pdf(nis: str, recibo: str):
+async def pdf(nis: str, recibo: str, request: Request):
     try:
         nis_i = _clean_nis(nis)
-        items = client.fetch_all_recibos(nis_i)
-        item = next((x for x in items if str(x.get("recibo")) == str(recibo)), None)
-        if not item:
+        ref = await client.resolve_recibo(nis_i, recibo)
+        if not ref:
             raise HTTPException(status_code=404, detail="Recibo no encontrado")
-        pdf_bytes = client.fetch_pdf_bytes(
-            nis=nis_i,
-            sec_nis=int(item.get("sec_nis", 0)),
-            sec_rec=int(item.get("sec_rec", 0)),
-            f_fact=str(item.get("f_fact") or item.get("mes")),
-        )
-        return Response(content=pdf_bytes, media_type="application/pdf", headers={"Cache-Control": "public, max-age=86400"})
-    except HTTPException:
+        sec_nis, sec_rec, f_fact = ref
+        headers = {"Cache-Control": "public, max-age=86400"}
+        # si ya está en disco se sirve el archivo directo (sendfile), sin pasar por memoria
+        path = await asyncio.to_thread(client.pdf_file, nis_i, sec_nis, sec_rec, f_fact)
+        if path:
+            # el almacén es direccionado por contenido: el nombre del archivo es el sha256
+            headers["ETag"] = '"%s"' % os.path.splitext(os.path.basename(path))[0]
+            if _not_modified(request, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
+            return FileResponse(path, media_type="application/pdf", headers=headers)
+        chunks = client.stream_pdf(nis_i, sec_nis, sec_rec, f_fact)
+        # el primer trozo se pide aquí para que un fallo de SEDAPAL siga siendo un 500
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            raise HTTPException(status_code=502, detail="SEDAPAL devolvió un PDF vacío")
+        return StreamingResponse(_prepend(first, chunks), media_type="application/pdf", headers=headers)
+    except (HTTPException, CircuitOpenError):
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _pdf_entries(nis_i: int, items: list):
+    """(nombre, bytes) de cada PDF en orden de llegada.
+
+    ZIP_CONCURRENCY workers descargan en paralelo; la cola de salida también
+    es de ZIP_CONCURRENCY, así que con un cliente lento los workers esperan
+    en vez de acumular PDFs en memoria.
+    """
+    todo: asyncio.Queue = asyncio.Queue()
+    for it in items:
+        todo.put_nowait(it)
+    done: asyncio.Queue = asyncio.Queue(maxsize=ZIP_CONCURRENCY)
+    errores = []
+
+    async def worker():
+        while True:
+            try:
+                it = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            recibo = it.get("recibo")
+            f_fact = str(it.get("f_fact") or it.get("mes"))
+            try:
+                data = await client.fetch_pdf_bytes(
+                    nis=nis_i,
+                    sec_nis=int(it.get("sec_nis", 0)),
+                    sec_rec=int(it.get("sec_rec", 0)),
+                    f_fact=f_fact,
+                )
+                await done.put((f"recibo_{recibo}_{f_fact[:10]}.pdf", data))
+            except Exception as e:
+                errores.append(f"{recibo}: {e}")
+
+    async def run():
+        await asyncio.gather(*(worker() for _ in range(ZIP_CONCURRENCY)))
+        await done.put(None)
+
+    runner = asyncio.ensure_future(run())
+    try:
+        while True:
+            entry = await done.get()
+            if entry is None:
+                break
+            yield entry
+        await runner
+        if errores:
+            yield "errores.txt", ("\n".join(errores) + "\n").encode()
+    finally:
+        runner.cancel()
+
+@app.get("/api/zip/{nis}")
+async def pdf_zip(nis: str):
+    try:
+        nis_i = _clean_nis(nis)
+        items = await client.fetch_all_recibos(nis_i)
+    except (HTTPException, CircuitOpenError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=404, detail="Sin recibos")
+    return StreamingResponse(
+        zip_stream(_pdf_entries(nis_i, items)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="recibos_{nis_i}.zip"'},
+    )
@@ -0,0 +1,159 @@
+import os, json, time, queue, base64, threading
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+POOL_SIZE = int(os.getenv("SEDAPAL_DRIVER_POOL", "2"))
+MAX_AGE = int(os.getenv("SEDAPAL_DRIVER_MAX_AGE", "1800"))
+MAX_USES = int(os.getenv("SEDAPAL_DRIVER_MAX_USES", "50"))
+CHECKOUT_TIMEOUT = float(os.getenv("SEDAPAL_DRIVER_CHECKOUT_TIMEOUT", "120"))
+# un buscador cuyo token vence en menos de esto se reemplaza antes de prestarlo
+TOKEN_MARGIN = int(os.getenv("SEDAPAL_DRIVER_TOKEN_MARGIN", "300"))
+
+
+def _token_exp(token: Optional[str]) -> Optional[float]:
+    """`exp` del JWT de SEDAPAL (epoch), o None si no se puede leer (igual que http_sedapal._token_exp)."""
+    try:
+        payload = token.split(".")[1]
+        data = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(data["exp"])
+    except Exception:
+        return None
+
+
+class _Slot:
+    def __init__(self, buscador: Any):
+        self.buscador = buscador
+        self.created = time.monotonic()
+        self.uses = 0
+        self.bad = False
+
+
+class BuscadorPool:
+    """Pool de buscadores ya con Chrome lanzado y sesión iniciada.
+
+    `factory` devuelve un SedapalBuscadorInteractivo listo (driver + login)
+    o lanza excepción. Cada checkout() presta uno; al devolverlo vuelve al
+    pool salvo que haya fallado, superado MAX_AGE/MAX_USES, que su token
+    esté por vencer o que el driver ya no responda, en cuyo caso se cierra y
+    se lanza otro en segundo plano.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int = POOL_SIZE,
+                 max_age: float = MAX_AGE, max_uses: int = MAX_USES):
+        self.factory = factory
+        self.size = size
+        self.max_age = max_age
+        self.max_uses = max_uses
+        self._idle: "queue.LifoQueue[_Slot]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._total = 0
+        self.created = 0
+        self.recycled = 0
+        self.last_error: Optional[str] = None
+
+    def _create(self) -> _Slot:
+        try:
+            slot = _Slot(self.factory())
+        except Exception as e:
+            with self._lock:
+                self._total -= 1
+            self.last_error = str(e)
+            raise
+        self.created += 1
+        return slot
+
+    def _destroy(self, slot: _Slot):
+        with self._lock:
+            self._total -= 1
+        self.recycled += 1
+        driver = getattr(slot.buscador, "driver", None)
+        if driver:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def _healthy(self, slot: _Slot) -> bool:
+        if slot.bad or getattr(slot.buscador, "_pool_bad", False) or slot.uses >= self.max_uses:
+            return False
+        if time.monotonic() - slot.created > self.max_age:
+            return False
+        exp = _token_exp(getattr(slot.buscador, "sedtoken", None))
+        if exp is not None and time.time() > exp - TOKEN_MARGIN:
+            return False
+        driver = getattr(slot.buscador, "driver", None)
+        if driver is None:
+            return True
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self._total < self.size:
+                self._total += 1
+                return True
+            return False
+
+    def _acquire(self) -> _Slot:
+        deadline = time.monotonic() + CHECKOUT_TIMEOUT
+        while True:
+            try:
+                slot = self._idle.get_nowait()
+            except queue.Empty:
+                if self._reserve():
+                    return self._create()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("No hay navegadores libres en el pool")
+                try:
+                    slot = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    raise TimeoutError("No hay navegadores libres en el pool")
+            if self._healthy(slot):
+                return slot
+            self._destroy(slot)
+
+    @contextmanager
+    def checkout(self):
+        slot = self._acquire()
+        try:
+            yield slot.buscador
+        except BaseException:
+            slot.bad = True
+            raise
+        finally:
+            slot.uses += 1
+            if self._healthy(slot):
+                self._idle.put(slot)
+            else:
+                self._destroy(slot)
+                self.prewarm(1)
+
+    def discard(self, buscador: Any):
+        """Marca el buscador prestado para que no vuelva al pool (p.ej. token vencido)."""
+        buscador._pool_bad = True
+
+    def prewarm(self, n: Optional[int] = None):
+        """Lanza en segundo plano hasta `n` buscadores (por defecto hasta llenar el pool)."""
+        def run(count):
+            for _ in range(count):
+                if not self._reserve():
+                    return
+                try:
+                    self._idle.put(self._create())
+                except Exception:
+                    return
+        count = self.size if n is None else n
+        threading.Thread(target=run, args=(count,), name="buscador-prewarm", daemon=True).start()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "total": self._total,
+            "idle": self._idle.qsize(),
+            "created": self.created,
+            "recycled": self.recycled,
+            "last_error": self.last_error,
+        }
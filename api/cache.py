@@ -0,0 +1,120 @@
+import threading, time, weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+_CACHES: "weakref.WeakSet[TTLCache]" = weakref.WeakSet()
+_SWEEPER: Optional[threading.Thread] = None
+
+
+class TTLCache:
+    """LRU con expiración por entrada y presupuesto opcional de bytes."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float,
+                 max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda v: 0)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        _CACHES.add(self)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _drop(self, key: Hashable):
+        _, _, size = self._data.pop(key)
+        self.bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, exp, _ = item
+            if exp <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # no entra: tampoco puede quedar el valor anterior de la clave
+            with self._lock:
+                if key in self._data:
+                    self._drop(key)
+            return
+        exp = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, exp, size)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (
+                    self.max_bytes is not None and self.bytes > self.max_bytes):
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            self._drop(key)
+            return item[0]
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            dead = [k for k, (_, exp, _) in self._data.items() if exp <= now]
+            for k in dead:
+                self._drop(k)
+            self.expirations += len(dead)
+        return len(dead)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def _sweep_loop(interval: float):
+    while True:
+        time.sleep(interval)
+        for cache in list(_CACHES):
+            try:
+                cache.sweep()
+            except Exception:
+                pass
+
+
+def start_sweeper(interval: float = 60.0):
+    """Hilo daemon que purga las entradas vencidas de todas las cachés."""
+    global _SWEEPER
+    if _SWEEPER is None or not _SWEEPER.is_alive():
+        _SWEEPER = threading.Thread(target=_sweep_loop, args=(interval,), name="cache-sweeper", daemon=True)
+        _SWEEPER.start()
+
+
+def all_stats() -> list:
+    return [c.stats() for c in list(_CACHES)]
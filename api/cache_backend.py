@@ -0,0 +1,351 @@
+"""Backends de caché compartidos entre workers/réplicas.
+
+SEDAPAL_CACHE_BACKEND elige uno:
+
+    memory                      solo en el proceso (por defecto, como antes)
+    sqlite  | sqlite:///ruta.db archivo SQLite compartido por los workers de una máquina
+    redis://[:clave@]host:6379/0  Redis/Valkey/KeyDB con el paquete `redis` (rediss:// para TLS)
+
+Todos guardan bytes con TTL. Un backend compartido que falla no tumba el
+pedido: get() devuelve None, set() no hace nada y se cuenta en stats().
+"""
+import os, abc, asyncio, sqlite3, tempfile, threading, time
+from typing import Any, Callable, Dict, Hashable, Optional
+from urllib.parse import urlparse
+
+try:
+    import redis
+except ImportError:  # opcional: sin redis quedan memory y sqlite
+    redis = None
+
+from api.cache import TTLCache
+
+BACKEND_URL = os.getenv("SEDAPAL_CACHE_BACKEND", "memory")
+SQLITE_PATH = os.getenv("SEDAPAL_CACHE_DB", os.path.join(tempfile.gettempdir(), "sedapal_cache.db"))
+SQLITE_MAX_MB = int(os.getenv("SEDAPAL_CACHE_DB_MB", "256"))
+REDIS_TIMEOUT = float(os.getenv("SEDAPAL_REDIS_TIMEOUT", "0.5"))
+_REDIS_ERRORS = (redis.RedisError, OSError) if redis else (OSError,)
+
+
+class CacheBackend(abc.ABC):
+    """Interfaz común; `shared` dice si otros procesos ven lo que se escribe."""
+
+    name = "base"
+    shared = False
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, value: bytes, ttl: float):
+        ...
+
+    @abc.abstractmethod
+    def add(self, key: str, value: bytes, ttl: float) -> Optional[bool]:
+        """Escribe solo si la clave no existe (o venció). Sirve de candado entre procesos.
+
+        None si el backend falló: quien espera el candado no debe quedarse esperando.
+        """
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abc.abstractmethod
+    def delete_if(self, key: str, value: bytes):
+        """Borra solo si la clave todavía vale `value`: libera un candado sin pisar
+        el de otro worker que lo tomó después de que el nuestro venciera."""
+
+    def _count(self, value: Optional[bytes]) -> Optional[bytes]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": self.name, "shared": self.shared, "hits": self.hits,
+                "misses": self.misses, "errors": self.errors}
+
+
+class MemoryBackend(CacheBackend):
+    """En el proceso; también sirve como doble de prueba de los compartidos."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int = 10000):
+        super().__init__()
+        self._data = TTLCache("backend_memory", maxsize=maxsize, ttl=3600)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._count(self._data.get(key))
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._data.set(key, value, ttl=ttl)
+
+    def add(self, key: str, value: bytes, ttl: float) -> Optional[bool]:
+        with self._lock:
+            if self._data.get(key) is not None:
+                return False
+            self._data.set(key, value, ttl=ttl)
+            return True
+
+    def delete(self, key: str):
+        self._data.pop(key)
+
+    def delete_if(self, key: str, value: bytes):
+        with self._lock:
+            if self._data.get(key) == value:
+                self._data.pop(key)
+
+
+class SqliteBackend(CacheBackend):
+    """Tabla clave/valor en SQLite (WAL) para los workers de una misma máquina."""
+
+    name = "sqlite"
+    shared = True
+    PRUNE_EVERY = 200
+
+    def __init__(self, path: str, max_bytes: int = SQLITE_MAX_MB * 1024 * 1024):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, exp REAL NOT NULL)")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS kv_exp ON kv (exp)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            row = self._conn().execute("SELECT value FROM kv WHERE key = ? AND exp > ?",
+                                       (key, time.time())).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        return self._count(bytes(row[0]) if row else None)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        try:
+            self._conn().execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, time.time() + ttl))
+        except sqlite3.Error:
+            self.errors += 1
+            return
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def add(self, key: str, value: bytes, ttl: float) -> Optional[bool]:
+        now = time.time()
+        try:
+            cur = self._conn().execute(
+                "INSERT INTO kv VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE "
+                "SET value = excluded.value, exp = excluded.exp WHERE kv.exp <= ?",
+                (key, value, now + ttl, now))
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        return cur.rowcount == 1
+
+    def delete(self, key: str):
+        try:
+            self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def delete_if(self, key: str, value: bytes):
+        try:
+            self._conn().execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, value))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def prune(self):
+        """Borra lo vencido y, si se pasa del presupuesto, lo que vence antes."""
+        conn = self._conn()
+        try:
+            conn.execute("DELETE FROM kv WHERE exp <= ?", (time.time(),))
+            total = conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM kv").fetchone()[0]
+            if total > self.max_bytes:
+                target = int(self.max_bytes * 0.9)
+                for key, size in conn.execute("SELECT key, LENGTH(value) FROM kv ORDER BY exp").fetchall():
+                    if total <= target:
+                        break
+                    conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+                    total -= size
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, object]:
+        return dict(super().stats(), path=self.path)
+
+
+class RedisBackend(CacheBackend):
+    """Sobre el paquete `redis` (opcional): pool de conexiones thread-safe y TLS con rediss://."""
+
+    name = "redis"
+    shared = True
+    # comparar y borrar en un solo paso del servidor
+    DELETE_IF = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+    def __init__(self, url: str, timeout: float = REDIS_TIMEOUT):
+        super().__init__()
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._delete_if = self.client.register_script(self.DELETE_IF)
+        u = urlparse(url)
+        # sin la clave, para stats()
+        self.url = f"{u.scheme}://{u.hostname or '127.0.0.1'}:{u.port or 6379}{u.path or '/0'}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self._count(self.client.get(key))
+        except _REDIS_ERRORS:
+            self.errors += 1
+            return None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        try:
+            self.client.set(key, value, px=max(1, int(ttl * 1000)))
+        except _REDIS_ERRORS:
+            self.errors += 1
+
+    def add(self, key: str, value: bytes, ttl: float) -> Optional[bool]:
+        try:
+            return bool(self.client.set(key, value, px=max(1, int(ttl * 1000)), nx=True))
+        except _REDIS_ERRORS:
+            self.errors += 1
+            return None
+
+    def delete(self, key: str):
+        try:
+            self.client.delete(key)
+        except _REDIS_ERRORS:
+            self.errors += 1
+
+    def delete_if(self, key: str, value: bytes):
+        try:
+            self._delete_if(keys=[key], args=[value])
+        except _REDIS_ERRORS:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, object]:
+        return dict(super().stats(), url=self.url)
+
+
+class SharedCache:
+    """TTLCache del proceso (L1, objetos) delante de un backend compartido (L2, bytes).
+
+    Con un backend no compartido se comporta igual que el TTLCache solo. Un
+    valor que llega del L2 se guarda en el L1 con `local_ttl(valor)` (o el TTL
+    del L1). Desde código async usar aget/aset: la E/S del L2 va en un hilo.
+    """
+
+    def __init__(self, local: TTLCache, backend: CacheBackend, prefix: str,
+                 encode: Callable[[Any], bytes], decode: Callable[[bytes], Any],
+                 local_ttl: Optional[Callable[[Any], float]] = None):
+        self.local = local
+        self.backend = backend
+        self.prefix = prefix
+        self.encode = encode
+        self.decode = decode
+        self.local_ttl = local_ttl
+        self.shared = backend.shared
+
+    def _key(self, key: Hashable) -> str:
+        return self.prefix + (":".join(map(str, key)) if isinstance(key, tuple) else str(key))
+
+    def _fill(self, key: Hashable, raw: Optional[bytes]) -> Any:
+        if raw is None:
+            return None
+        try:
+            value = self.decode(raw)
+        except Exception:
+            self.backend.errors += 1
+            return None
+        ttl = self.local_ttl(value) if self.local_ttl else None
+        if ttl is None or ttl > 0:
+            self.local.set(key, value, ttl=ttl)
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.local.get(key)
+        if value is not None or not self.shared:
+            return default if value is None else value
+        value = self._fill(key, self.backend.get(self._key(key)))
+        return default if value is None else value
+
+    def get_shared(self, key: Hashable) -> Any:
+        """Lo que hay en el L2, salteando el L1 (p.ej. para ver si otro worker ya refrescó)."""
+        if not self.shared:
+            return None
+        return self._fill(key, self.backend.get(self._key(key)))
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl=ttl)
+        if self.shared:
+            self.backend.set(self._key(key), self.encode(value), self.local.ttl if ttl is None else ttl)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if self.shared:
+            self.backend.delete(self._key(key))
+        return self.local.pop(key, default)
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        value = self.local.get(key)
+        if value is not None or not self.shared:
+            return default if value is None else value
+        value = await asyncio.to_thread(self.get_shared, key)
+        return default if value is None else value
+
+    async def aget_shared(self, key: Hashable) -> Any:
+        if not self.shared:
+            return None
+        return await asyncio.to_thread(self.get_shared, key)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl=ttl)
+        if self.shared:
+            await asyncio.to_thread(self.backend.set, self._key(key), self.encode(value),
+                                    self.local.ttl if ttl is None else ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.local.stats(), backend=self.backend.name if self.shared else None)
+
+
+def lock_owner() -> bytes:
+    """Valor único para un candado tomado con add(): se libera con delete_if()."""
+    return os.urandom(16).hex().encode()
+
+
+def from_url(url: str) -> CacheBackend:
+    url = (url or "memory").strip()
+    if url == "memory":
+        return MemoryBackend()
+    if url == "sqlite":
+        return SqliteBackend(SQLITE_PATH)
+    if url.startswith("sqlite:///"):
+        return SqliteBackend(url[len("sqlite://"):])
+    if url.startswith(("redis://", "rediss://")):
+        if redis is None:
+            raise ValueError("SEDAPAL_CACHE_BACKEND=redis:// requiere el paquete redis (pip install redis)")
+        return RedisBackend(url)
+    raise ValueError(f"SEDAPAL_CACHE_BACKEND desconocido: {url}")
+
+
+def from_env() -> CacheBackend:
+    return from_url(BACKEND_URL)
@@ -0,0 +1,204 @@
+"""gzip/brotli negociado por Accept-Encoding, para FastAPI (middleware ASGI) y Flask.
+
+Los cuerpos chicos (< COMPRESS_MIN) y los formatos que ya vienen comprimidos
+(PDF, ZIP, imágenes) se mandan tal cual. Los listados cacheados guardan su
+cuerpo ya comprimido en la entrada de caché (ver `cached_body`), así un hit
+caliente no gasta CPU comprimiendo.
+"""
+import os, gzip, asyncio
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se ofrece solo gzip
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+COMPRESS_MIN = int(os.getenv("SEDAPAL_COMPRESS_MIN", "1024"))
+# niveles para respuestas dinámicas (se comprimen en cada pedido)...
+GZIP_LEVEL = int(os.getenv("SEDAPAL_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("SEDAPAL_BROTLI_QUALITY", "4"))
+# ...y para cuerpos cacheados, que se comprimen una vez y se sirven muchas
+GZIP_LEVEL_CACHED = 9
+BROTLI_QUALITY_CACHED = 11
+
+_SKIP_TYPES = ("application/pdf", "application/zip", "application/gzip", "application/x-gzip",
+               "image/", "audio/", "video/", "font/woff")
+
+
+def _accepted(accept_encoding: Optional[str]) -> Dict[str, float]:
+    out = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            out[name.strip().lower()] = q
+    return out
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """"br", "gzip" o None (identity) según lo que acepte el cliente."""
+    acc = _accepted(accept_encoding)
+    star = acc.get("*", 0.0)
+    best, best_q = None, 0.0
+    for enc in (("br", "gzip") if brotli else ("gzip",)):
+        q = acc.get(enc, star)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def compressible(content_type: Optional[str], size: int) -> bool:
+    ct = (content_type or "").lower()
+    return size >= COMPRESS_MIN and not any(ct.startswith(t) for t in _SKIP_TYPES)
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY_CACHED if cached else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL_CACHED if cached else GZIP_LEVEL, mtime=0)
+
+
+def cached_body(holder: Dict[str, Any], render: Callable[[], bytes], accept_encoding: Optional[str],
+                content_type: str = "application/json") -> Tuple[bytes, Optional[str]]:
+    """(cuerpo, encoding) memoizado en holder["_bodies"]: se serializa y comprime una vez por variante.
+
+    `holder` es la entrada de caché; su contenido no debe cambiar mientras viva.
+    """
+    bodies = holder.get("_bodies")
+    if bodies is None:
+        bodies = holder["_bodies"] = {}
+    raw = bodies.get(None)
+    if raw is None:
+        raw = bodies[None] = render()
+    enc = negotiate(accept_encoding)
+    if enc is None or not compressible(content_type, len(raw)):
+        return raw, None
+    body = bodies.get(enc)
+    if body is None:
+        body = bodies[enc] = compress(raw, enc, cached=True)
+    return body, enc
+
+
+async def acached_body(holder: Dict[str, Any], render: Callable[[], bytes], accept_encoding: Optional[str],
+                       content_type: str = "application/json") -> Tuple[bytes, Optional[str]]:
+    """cached_body para código async: si la variante no está memoizada, se arma en un hilo.
+
+    Serializar y comprimir a la calidad máxima de brotli lleva milisegundos: no en el event loop.
+    """
+    bodies = holder.get("_bodies") or {}
+    raw = bodies.get(None)
+    enc = negotiate(accept_encoding)
+    if raw is not None and (enc is None or enc in bodies or not compressible(content_type, len(raw))):
+        return cached_body(holder, render, accept_encoding, content_type)
+    return await asyncio.to_thread(cached_body, holder, render, accept_encoding, content_type)
+
+
+def encoded_etag(etag: Optional[str], encoding: Optional[str]) -> Optional[str]:
+    """ETag fuerte de la variante comprimida: '"<hash>"' -> '"<hash>-br"'.
+
+    Cada content-coding es otra representación, así que no puede compartir
+    el validador fuerte de la versión sin comprimir. Los débiles (W/) quedan igual.
+    """
+    if not etag or not encoding or etag.startswith("W/") or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def base_etag(tag: str) -> str:
+    """Inverso de encoded_etag para comparar If-None-Match: sin W/ ni sufijo de encoding."""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for enc in ("br", "gzip"):
+        if tag.endswith(f'-{enc}"'):
+            return tag[:-len(enc) - 2] + '"'
+    return tag
+
+
+def _add_vary(value: Optional[str]) -> str:
+    if not value:
+        return "Accept-Encoding"
+    if "accept-encoding" in value.lower():
+        return value
+    return value + ", Accept-Encoding"
+
+
+class CompressionMiddleware:
+    """Middleware ASGI: comprime respuestas de un solo cuerpo; los streams pasan sin tocar."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = None
+        for k, v in scope.get("headers") or ():
+            if k == b"accept-encoding":
+                accept = v.decode("latin-1")
+        enc = negotiate(accept)
+        if enc is None:
+            return await self.app(scope, receive, send)
+
+        start: Optional[dict] = None
+        passthrough = False
+
+        async def wrapped(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+            if start is not None:
+                first, start_msg = message, start
+                start = None
+                headers = {k.lower(): v for k, v in start_msg.get("headers", [])}
+                body = first.get("body", b"")
+                ct = headers.get(b"content-type", b"").decode("latin-1")
+                if (first.get("more_body") or b"content-encoding" in headers
+                        or not compressible(ct, len(body))):
+                    passthrough = True
+                    await send(start_msg)
+                    return await send(first)
+                data = compress(body, enc)
+                raw_headers = [(k, v) for k, v in start_msg.get("headers", [])
+                               if k.lower() not in (b"content-length", b"vary", b"etag")]
+                if b"etag" in headers:
+                    etag = encoded_etag(headers[b"etag"].decode("latin-1"), enc)
+                    raw_headers.append((b"etag", etag.encode("latin-1")))
+                raw_headers += [
+                    (b"content-encoding", enc.encode()),
+                    (b"content-length", str(len(data)).encode()),
+                    (b"vary", _add_vary(headers.get(b"vary", b"").decode("latin-1")).encode()),
+                ]
+                await send(dict(start_msg, headers=raw_headers))
+                return await send({"type": "http.response.body", "body": data})
+            return await send(message)
+
+        await self.app(scope, receive, wrapped)
+
+
+def compress_flask_response(response, accept_encoding: Optional[str]):
+    """after_request de Flask: misma política que el middleware ASGI."""
+    if response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers:
+        return response
+    enc = negotiate(accept_encoding)
+    body = response.get_data()
+    if enc is None or not compressible(response.content_type, len(body)):
+        return response
+    response.set_data(compress(body, enc))
+    response.headers["Content-Encoding"] = enc
+    if "ETag" in response.headers:
+        response.headers["ETag"] = encoded_etag(response.headers["ETag"], enc)
+    response.headers["Vary"] = _add_vary(response.headers.get("Vary"))
+    return response
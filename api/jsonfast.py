@@ -0,0 +1,64 @@
+"""JSON rápido con respaldo: orjson -> msgspec -> json de la stdlib.
+
+`dumps` siempre devuelve bytes UTF-8 compactos y `loads` acepta bytes o str,
+así el resto del código no depende de cuál esté instalado. SEDAPAL_JSON
+fuerza uno ("orjson", "msgspec" o "json"), útil para comparar en bench/.
+"""
+import os, json
+from typing import Any, Callable, Tuple
+
+_WANT = os.getenv("SEDAPAL_JSON", "").lower()
+
+
+def _stdlib() -> Tuple[str, Callable[[Any], bytes], Callable[[Any], bytes], Callable[[Any], Any]]:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+    def dumps_sorted(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str).encode()
+
+    return "json", dumps, dumps_sorted, json.loads
+
+
+def _orjson():
+    import orjson
+
+    opts = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str, option=opts)
+
+    def dumps_sorted(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str, option=opts | orjson.OPT_SORT_KEYS)
+
+    return "orjson", dumps, dumps_sorted, orjson.loads
+
+
+def _msgspec():
+    import msgspec
+
+    enc = msgspec.json.Encoder(enc_hook=str)
+    enc_sorted = msgspec.json.Encoder(enc_hook=str, order="sorted")
+    dec = msgspec.json.Decoder()
+    return "msgspec", enc.encode, enc_sorted.encode, dec.decode
+
+
+def _pick():
+    order = [_orjson, _msgspec]
+    if _WANT == "json":
+        return _stdlib()
+    if _WANT == "msgspec":
+        order.reverse()
+    for backend in order:
+        try:
+            return backend()
+        except (ImportError, TypeError):  # TypeError: msgspec viejo sin order=
+            continue
+    return _stdlib()
+
+
+BACKEND, dumps, dumps_sorted, loads = _pick()
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode()
@@ -0,0 +1,173 @@
+import bisect, threading, time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# en segundos; SEDAPAL va de ~100 ms a timeouts de 60 s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+LAUNCH_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Labels = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                out.append(f"{self.name}{_fmt_labels(key)} {_fmt_value(v)}")
+        return out
+
+
+class Histogram:
+    """Histograma acumulativo estilo Prometheus (buckets fijos + _sum + _count)."""
+
+    def __init__(self, name: str, doc: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                # [conteo por bucket (+Inf al final), suma]
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(s[0]), s[1]) for k, s in sorted(self._series.items())]
+        for key, counts, total in series:
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_fmt_labels(key, (('le', _fmt_value(le)),))} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_value(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(key)} {acc}")
+        return out
+
+
+class Registry:
+    """Métricas propias + colectores que leen los stats() existentes al momento del scrape."""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, object], float]]]] = []
+
+    def counter(self, name: str, doc: str) -> Counter:
+        m = Counter(name, doc)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, doc: str, buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        m = Histogram(name, doc, buckets)
+        self._metrics.append(m)
+        return m
+
+    def collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, Dict[str, object], float]]]):
+        """`fn` devuelve (nombre, tipo, ayuda, labels, valor) por muestra."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        # el formato de texto exige las muestras de cada métrica juntas: los colectores
+        # las dan por endpoint/caché, así que se agrupan por nombre antes de escribir
+        groups: Dict[str, Tuple[str, str, List[str]]] = {}
+        for fn in self._collectors:
+            try:
+                samples = list(fn())
+            except Exception:
+                continue
+            for name, kind, doc, labels, value in samples:
+                if value is None:
+                    continue
+                if name not in groups:
+                    groups[name] = (kind, doc, [])
+                groups[name][2].append(f"{name}{_fmt_labels(_labels(labels))} {_fmt_value(value)}")
+        for name, (kind, doc, samples) in groups.items():
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "sedapal_upstream_request_seconds", "Latencia de las llamadas a SEDAPAL por endpoint")
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "sedapal_upstream_errors_total", "Llamadas a SEDAPAL fallidas por endpoint")
+REQUEST_SECONDS = REGISTRY.histogram(
+    "sedapal_http_request_seconds", "Latencia de las respuestas del backend por ruta")
+DRIVER_LAUNCH_SECONDS = REGISTRY.histogram(
+    "sedapal_driver_launch_seconds", "Tiempo en dejar listo un buscador (driver + login)", LAUNCH_BUCKETS)
+
+
+@REGISTRY.collector
+def _cache_samples():
+    from api.cache import all_stats
+    for st in all_stats():
+        labels = {"cache": st["name"]}
+        yield "sedapal_cache_hits_total", "counter", "Aciertos de caché", labels, st["hits"]
+        yield "sedapal_cache_misses_total", "counter", "Fallos de caché", labels, st["misses"]
+        yield "sedapal_cache_evictions_total", "counter", "Entradas desalojadas por LRU/bytes", labels, st["evictions"]
+        yield "sedapal_cache_entries", "gauge", "Entradas en caché", labels, st["size"]
+        yield "sedapal_cache_bytes", "gauge", "Bytes en caché", labels, st["bytes"]
+
+
+def upstream_endpoint(url: str, body: dict) -> Dict[str, str]:
+    """Labels del endpoint: login, deudas, pagados (con página) o recibo-pdf."""
+    path = url.rsplit("/", 1)[-1]
+    if "deudas" in path:
+        return {"endpoint": "deudas", "page": str(body.get("page_num", ""))}
+    if "pagados" in path:
+        return {"endpoint": "pagados", "page": str(body.get("page_num", ""))}
+    return {"endpoint": path, "page": ""}
@@ -0,0 +1,191 @@
+import os, hashlib, tempfile
+from typing import Hashable, Optional
+
+PDF_DIR = os.getenv("SEDAPAL_PDF_DIR", os.path.join(tempfile.gettempdir(), "sedapal_pdfs"))
+PDF_DIR_MB = int(os.getenv("SEDAPAL_PDF_DIR_MB", "512"))
+
+
+def _atomic_write(path: str, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class PdfStore:
+    """Almacén de PDFs en disco, direccionado por contenido.
+
+    objects/<sha256>.pdf guarda cada PDF una sola vez; index/<sha1(clave)>
+    contiene el sha256 del PDF de esa clave. Todo se escribe con rename
+    atómico, así varios workers (y reinicios) comparten el mismo directorio.
+    El mtime de cada objeto marca su último uso y sirve para desalojar por
+    tamaño los menos usados.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects = os.path.join(root, "objects")
+        self.index = os.path.join(root, "index")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.index, exist_ok=True)
+        self._written = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _index_path(self, key: Hashable) -> str:
+        return os.path.join(self.index, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects, digest + ".pdf")
+
+    def digest(self, key: Hashable) -> Optional[str]:
+        try:
+            with open(self._index_path(key)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def path(self, key: Hashable) -> Optional[str]:
+        """Ruta del PDF para servirlo tal cual (sendfile), o None."""
+        digest = self.digest(key)
+        if digest:
+            path = self.object_path(digest)
+            try:
+                os.utime(path)
+                self.hits += 1
+                return path
+            except OSError:
+                # objeto desalojado: el índice quedó colgando
+                try:
+                    os.unlink(self._index_path(key))
+                except OSError:
+                    pass
+        self.misses += 1
+        return None
+
+    def read(self, key: Hashable) -> Optional[bytes]:
+        path = self.path(key)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key: Hashable, data: bytes) -> str:
+        w = self.writer(key)
+        w.write(data)
+        return w.commit()
+
+    def writer(self, key: Hashable) -> "PdfWriter":
+        return PdfWriter(self, key)
+
+    def _commit(self, key: Hashable, tmp: str, digest: str, size: int):
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            os.unlink(tmp)
+        else:
+            os.replace(tmp, path)
+            self._written += size
+        _atomic_write(self._index_path(key), digest.encode())
+        # revisar el presupuesto cada ~5% escrito, no en cada put
+        if self._written >= self.max_bytes // 20:
+            self._written = 0
+            self.evict()
+
+    def evict(self) -> int:
+        entries = []
+        total = 0
+        with os.scandir(self.objects) as it:
+            for e in it:
+                if e.name.startswith(".tmp-"):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+        removed = set()
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed.add(os.path.basename(path)[:-len(".pdf")])
+        if removed:
+            self._drop_index(removed)
+        self.evictions += len(removed)
+        return len(removed)
+
+    def _drop_index(self, digests: set):
+        """Borra las entradas de index/ que apuntan a objetos desalojados."""
+        with os.scandir(self.index) as it:
+            for e in it:
+                if e.name.startswith(".tmp-"):
+                    continue
+                try:
+                    with open(e.path) as f:
+                        if f.read().strip() in digests:
+                            os.unlink(e.path)
+                except OSError:
+                    continue
+
+    def stats(self) -> dict:
+        return {"name": "pdf_disk", "root": self.root, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+
+class PdfWriter:
+    """Escritura incremental de un PDF al almacén; solo aparece al hacer commit()."""
+
+    def __init__(self, store: PdfStore, key: Hashable):
+        self.store = store
+        self.key = key
+        fd, self.tmp = tempfile.mkstemp(dir=store.objects, prefix=".tmp-")
+        self.f = os.fdopen(fd, "wb")
+        self.h = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.f.write(data)
+        self.h.update(data)
+        self.size += len(data)
+
+    def commit(self) -> str:
+        self.f.close()
+        digest = self.h.hexdigest()
+        self.store._commit(self.key, self.tmp, digest, self.size)
+        return digest
+
+    def abort(self):
+        self.f.close()
+        try:
+            os.unlink(self.tmp)
+        except OSError:
+            pass
+
+
+def from_env() -> Optional[PdfStore]:
+    if not PDF_DIR:
+        return None
+    try:
+        return PdfStore(PDF_DIR, PDF_DIR_MB * 1024 * 1024)
+    except OSError:
+        return None
@@ -0,0 +1,73 @@
+import base64, binascii, re
+from typing import Callable
+from api import jsonfast
+
+# "bresp": "<base64>" o "bRESP": "<base64>"
+_VALUE_START = re.compile(rb'"(?:bresp|bRESP)"\s*:\s*"')
+_WS = b" \t\r\n"
+
+
+class Base64PdfDecoder:
+    """Decodifica en vuelo el PDF base64 de la respuesta JSON de recibo-pdf.
+
+    Se alimenta con los trozos tal como llegan de SEDAPAL y devuelve los bytes
+    del PDF ya decodificados, sin tener nunca el JSON ni el PDF completos en
+    memoria. Igual que _decode_pdf, un valor vacío ("bresp": "") se salta y
+    se busca la otra clave. Si el valor no es un string (p.ej. {"content": ...})
+    se guarda el cuerpo y finish() cae al parseo normal con `fallback`.
+    """
+
+    def __init__(self, fallback: Callable[[dict], bytes]):
+        self.fallback = fallback
+        self._head = bytearray()
+        self._pos = 0  # en _head ya se descartaron las claves vacías antes de aquí
+        self._state = "seek"  # seek -> value -> done
+        self._pending = b""
+        self._carry = b""
+
+    def _decode(self, data: bytes) -> bytes:
+        data = self._carry + data
+        self._carry = b""
+        if data.endswith(b"\\"):
+            self._carry, data = b"\\", data[:-1]
+        if b"\\" in data:
+            data = data.replace(b"\\/", b"/").replace(b"\\n", b"").replace(b"\\r", b"")
+        data = self._pending + data.translate(None, _WS)
+        n = len(data) - len(data) % 4
+        self._pending = data[n:]
+        return binascii.a2b_base64(data[:n]) if n else b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self._state == "seek":
+            self._head += chunk
+            while True:
+                m = _VALUE_START.search(self._head, self._pos)
+                if not m:
+                    return b""
+                if m.end() == len(self._head):
+                    # todavía no se sabe si el valor viene vacío
+                    self._pos = m.start()
+                    return b""
+                if self._head[m.end()] != ord('"'):
+                    break
+                self._pos = m.end() + 1
+            chunk = bytes(self._head[m.end():])
+            self._head = bytearray()
+            self._state = "value"
+        if self._state == "value":
+            end = chunk.find(b'"')
+            if end < 0:
+                return self._decode(chunk)
+            self._state = "done"
+            return self._decode(chunk[:end])
+        return b""
+
+    def finish(self) -> bytes:
+        if self._state == "seek":
+            return self.fallback(jsonfast.loads(bytes(self._head) or b"null"))
+        if self._state == "value":
+            raise RuntimeError("Respuesta PDF incompleta")
+        if self._pending:
+            pending, self._pending = self._pending, b""
+            return base64.b64decode(pending + b"=" * (-len(pending) % 4))
+        return b""
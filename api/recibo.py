@@ -0,0 +1,77 @@
+import sys
+from datetime import date
+from typing import Any, Dict, Iterable, List, Tuple
+
+# campos que se sirven a la PWA o que hacen falta para pedir el PDF; el resto del bRESP se descarta
+FIELDS = ("recibo", "nis_rad", "sec_nis", "sec_rec", "f_fact", "vencimiento", "mes",
+          "total_fact", "estado", "est_rec")
+
+_intern = lambda v: sys.intern(v) if isinstance(v, str) else v
+
+
+def _ordinal(val: Any) -> int:
+    try:
+        return date.fromisoformat(str(val)[:10]).toordinal()
+    except ValueError:
+        return 0
+
+
+class Recibo:
+    """Recibo tal como se guarda en las cachés: solo FIELDS, con la fecha ya parseada.
+
+    Los valores se guardan como llegaron de SEDAPAL para que to_dict() devuelva
+    el mismo JSON de siempre; los estados se internan porque se repiten en
+    todos los recibos. `fecha` (ordinal de f_fact, o de mes si falta) solo se
+    usa para ordenar.
+    """
+
+    __slots__ = FIELDS + ("fecha",)
+
+    def __init__(self, recibo=None, nis_rad=None, sec_nis=None, sec_rec=None, f_fact=None,
+                 vencimiento=None, mes=None, total_fact=None, estado=None, est_rec=None):
+        self.recibo = recibo
+        self.nis_rad = nis_rad
+        self.sec_nis = sec_nis
+        self.sec_rec = sec_rec
+        self.f_fact = f_fact
+        self.vencimiento = vencimiento
+        self.mes = mes
+        self.total_fact = total_fact
+        self.estado = _intern(estado)
+        self.est_rec = _intern(est_rec)
+        self.fecha = _ordinal(f_fact or mes or "")
+
+    @classmethod
+    def from_upstream(cls, it: Dict[str, Any]) -> "Recibo":
+        g = it.get
+        return cls(g("recibo"), g("nis_rad"), g("sec_nis"), g("sec_rec"), g("f_fact"),
+                   g("vencimiento"), g("mes"), g("total_fact"), g("estado"), g("est_rec"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        # mismas claves que traía el dict de SEDAPAL (las ausentes no se inventan)
+        return {k: v for k in FIELDS if (v := getattr(self, k)) is not None}
+
+    @property
+    def key(self) -> str:
+        return str(self.recibo or self.sec_rec)
+
+    @property
+    def ref(self) -> Tuple[int, int, str]:
+        """(sec_nis, sec_rec, f_fact) para pedir el PDF."""
+        return (int(self.sec_nis or 0), int(self.sec_rec or 0), str(self.f_fact or self.mes))
+
+    @property
+    def pendiente(self) -> bool:
+        # mismo criterio que la PWA: solo "cobrado" cuenta como pagado
+        return str(self.estado or self.est_rec or "").lower() != "cobrado"
+
+    def __repr__(self) -> str:
+        return f"Recibo({self.recibo!r}, f_fact={self.f_fact!r}, estado={self.estado!r})"
+
+
+def from_upstream(items: Iterable[Dict[str, Any]]) -> List[Recibo]:
+    return [Recibo.from_upstream(it) for it in items]
+
+
+def as_dicts(recibos: Iterable[Recibo]) -> List[Dict[str, Any]]:
+    return [r.to_dict() for r in recibos]
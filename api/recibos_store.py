@@ -0,0 +1,160 @@
+import os, sqlite3, tempfile, threading, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from api import jsonfast
+
+DB_PATH = os.getenv("SEDAPAL_DB", os.path.join(tempfile.gettempdir(), "sedapal_recibos.db"))
+
+PENDIENTE = "PENDIENTE"
+PAGADO = "PAGADO"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recibos (
+    nis        INTEGER NOT NULL,
+    rkey       TEXT    NOT NULL,
+    recibo     TEXT,
+    f_fact     TEXT    NOT NULL,
+    estado     TEXT    NOT NULL,
+    sec_nis    INTEGER,
+    sec_rec    INTEGER,
+    data       TEXT    NOT NULL,
+    updated_at REAL    NOT NULL,
+    PRIMARY KEY (nis, rkey)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS recibos_nis_fecha  ON recibos (nis, f_fact);
+CREATE INDEX IF NOT EXISTS recibos_nis_estado ON recibos (nis, estado, f_fact);
+CREATE INDEX IF NOT EXISTS recibos_nis_recibo ON recibos (nis, recibo);
+CREATE TABLE IF NOT EXISTS sync (
+    nis       INTEGER PRIMARY KEY,
+    synced_at REAL NOT NULL,
+    full_at   REAL NOT NULL
+);
+"""
+
+
+def _fecha(it: dict) -> str:
+    return str(it.get("f_fact") or it.get("mes") or "")[:10]
+
+
+def _int(v) -> Optional[int]:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class ReciboStore:
+    """Historial de recibos en SQLite (WAL), compartido entre workers y reinicios.
+
+    Una fila por (nis, recibo) con el JSON tal como lo devuelve SEDAPAL más
+    las columnas por las que se consulta (f_fact, estado). Cada hilo usa su
+    propia conexión; desde código async hay que llamarlo con to_thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, nis: int, deudas: Optional[List[dict]], pagados: List[dict], full_at: float,
+             key: Callable[[dict], str]):
+        """Escribe un listado recién traído: deudas reemplaza las pendientes, pagados se fusiona.
+
+        deudas=None (la llamada de deudas falló) deja las pendientes como estaban.
+        """
+        now = time.time()
+
+        def row(it, estado):
+            return (nis, key(it), str(it.get("recibo")) if it.get("recibo") is not None else None,
+                    _fecha(it), estado, _int(it.get("sec_nis")), _int(it.get("sec_rec")),
+                    jsonfast.dumps_str(it), now)
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if deudas is not None:
+                conn.execute("DELETE FROM recibos WHERE nis = ? AND estado = ?", (nis, PENDIENTE))
+            conn.executemany(
+                "INSERT OR REPLACE INTO recibos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row(it, PAGADO) for it in pagados] + [row(it, PENDIENTE) for it in deudas or ()],
+            )
+            conn.execute("INSERT OR REPLACE INTO sync VALUES (?, ?, ?)", (nis, now, full_at))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def history(self, nis: int, pagados_max: int) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        sync = conn.execute("SELECT synced_at, full_at FROM sync WHERE nis = ?", (nis,)).fetchone()
+        if not sync:
+            return None
+        deudas = conn.execute(
+            "SELECT data FROM recibos WHERE nis = ? AND estado = ? ORDER BY f_fact DESC",
+            (nis, PENDIENTE)).fetchall()
+        pagados = conn.execute(
+            "SELECT data FROM recibos WHERE nis = ? AND estado = ? ORDER BY f_fact DESC LIMIT ?",
+            (nis, PAGADO, pagados_max)).fetchall()
+        return {
+            "deudas": [jsonfast.loads(d) for (d,) in deudas],
+            "pagados": [jsonfast.loads(d) for (d,) in pagados],
+            "synced_at": sync[0],
+            "full_at": sync[1],
+        }
+
+    def query(self, nis: int, desde: Optional[str] = None, hasta: Optional[str] = None,
+              solo_pendientes: bool = False, limit: int = 500) -> List[dict]:
+        """Recibos de un NIS por rango de f_fact (YYYY-MM-DD, inclusive) y/o solo pendientes."""
+        sql = "SELECT data, estado FROM recibos WHERE nis = ?"
+        args: list = [nis]
+        if solo_pendientes:
+            sql += " AND estado = ?"
+            args.append(PENDIENTE)
+        if desde:
+            sql += " AND f_fact >= ?"
+            args.append(desde[:10])
+        if hasta:
+            sql += " AND f_fact <= ?"
+            args.append(hasta[:10])
+        sql += " ORDER BY f_fact DESC LIMIT ?"
+        args.append(limit)
+        out = []
+        for data, estado in self._conn().execute(sql, args):
+            it = jsonfast.loads(data)
+            it["estado_historial"] = estado
+            out.append(it)
+        return out
+
+    def ref(self, nis: int, recibo: str) -> Optional[Tuple[int, int, str]]:
+        row = self._conn().execute(
+            "SELECT sec_nis, sec_rec, data FROM recibos WHERE nis = ? AND recibo = ? LIMIT 1",
+            (nis, str(recibo))).fetchone()
+        if not row:
+            return None
+        it = jsonfast.loads(row[2])
+        return (row[0] or 0, row[1] or 0, str(it.get("f_fact") or it.get("mes")))
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        return {
+            "path": self.path,
+            "recibos": conn.execute("SELECT COUNT(*) FROM recibos").fetchone()[0],
+            "nis": conn.execute("SELECT COUNT(*) FROM sync").fetchone()[0],
+        }
+
+
+def from_env() -> Optional[ReciboStore]:
+    if not DB_PATH:
+        return None
+    try:
+        return ReciboStore(DB_PATH)
+    except sqlite3.Error:
+        return None
@@ -0,0 +1,154 @@
+import os, asyncio, time
+from typing import Dict, Optional
+
+LIMIT_INITIAL = float(os.getenv("SEDAPAL_LIMIT_INITIAL", "8"))
+LIMIT_MIN = float(os.getenv("SEDAPAL_LIMIT_MIN", "1"))
+LIMIT_MAX = float(os.getenv("SEDAPAL_LIMIT_MAX", "64"))
+LIMIT_TARGET_LATENCY = float(os.getenv("SEDAPAL_LIMIT_TARGET_LATENCY", "5"))
+BREAKER_FAILURES = int(os.getenv("SEDAPAL_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("SEDAPAL_BREAKER_RESET", "30"))
+
+
+class CircuitOpenError(RuntimeError):
+    """SEDAPAL está marcado como caído: se falla rápido sin llamarlo."""
+
+
+class AIMDLimiter:
+    """Límite de concurrencia adaptativo (crece +1/limit por éxito, se parte a la mitad al fallar).
+
+    Una respuesta más lenta que `target_latency` cuenta como señal de
+    saturación igual que un error. Solo se reduce una vez por ventana de
+    latencia para no desplomar el límite con una ráfaga de fallos simultáneos.
+    """
+
+    def __init__(self, name: str, initial: float = LIMIT_INITIAL, minimum: float = LIMIT_MIN,
+                 maximum: float = LIMIT_MAX, target_latency: float = LIMIT_TARGET_LATENCY):
+        self.name = name
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+        self._last_cut = 0.0
+        self.successes = 0
+        self.drops = 0
+        self.latency_ewma = 0.0
+
+    async def acquire(self):
+        async with self._cond:
+            while self.in_flight >= int(self.limit):
+                await self._cond.wait()
+            self.in_flight += 1
+
+    async def release(self, latency: float, ok: Optional[bool]):
+        """ok=None: la llamada se canceló, libera el lugar sin mover el límite."""
+        async with self._cond:
+            self.in_flight -= 1
+            if ok is None:
+                self._cond.notify_all()
+                return
+            self.latency_ewma = latency if not self.latency_ewma else 0.8 * self.latency_ewma + 0.2 * latency
+            now = time.monotonic()
+            if ok and latency <= self.target_latency:
+                self.successes += 1
+                # solo crece si de verdad se está usando; si no, el límite se infla sin medir nada
+                if self.in_flight + 1 >= self.limit / 2:
+                    self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif now - self._last_cut > max(latency, self.target_latency):
+                self.drops += 1
+                self._last_cut = now
+                self.limit = max(self.minimum, self.limit / 2)
+            self._cond.notify_all()
+
+    def pressure(self) -> float:
+        """Fracción del límite en uso (0..1+)."""
+        return self.in_flight / max(self.limit, 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "drops": self.drops,
+            "latency_ewma": round(self.latency_ewma, 3),
+        }
+
+
+class CircuitBreaker:
+    """closed -> open tras N fallos seguidos; tras `reset` segundos deja pasar una prueba (half_open)."""
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET):
+        self.name = name
+        self.max_failures = failures
+        self.reset = reset
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._probe = False
+
+    def before(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset:
+                self.rejected += 1
+                raise CircuitOpenError(f"SEDAPAL no disponible ({self.name}), reintente en unos segundos")
+            self.state = "half_open"
+            self._probe = False
+        if self.state == "half_open":
+            if self._probe:
+                self.rejected += 1
+                raise CircuitOpenError(f"SEDAPAL no disponible ({self.name}), probando conexión")
+            self._probe = True
+
+    def success(self):
+        self.failures = 0
+        self.state = "closed"
+        self._probe = False
+
+    def abandon(self):
+        """La llamada se canceló antes de saber nada de SEDAPAL: libera la prueba sin juzgar."""
+        self._probe = False
+
+    def failure(self):
+        self.failures += 1
+        self._probe = False
+        if self.state == "half_open" or self.failures >= self.max_failures:
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips, "rejected": self.rejected}
+
+
+class Upstream:
+    """Limitador + breaker por endpoint de SEDAPAL."""
+
+    def __init__(self):
+        self.limiters: Dict[str, AIMDLimiter] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def limiter(self, endpoint: str) -> AIMDLimiter:
+        if endpoint not in self.limiters:
+            self.limiters[endpoint] = AIMDLimiter(endpoint)
+        return self.limiters[endpoint]
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(endpoint)
+        return self.breakers[endpoint]
+
+    def healthy(self) -> bool:
+        return all(b.state == "closed" for b in self.breakers.values())
+
+    def pressure(self) -> float:
+        return max((l.pressure() for l in self.limiters.values()), default=0.0)
+
+    def stats(self) -> dict:
+        return {
+            ep: dict(self.limiter(ep).stats(), breaker=self.breaker(ep).stats())
+            for ep in sorted(set(self.limiters) | set(self.breakers))
+        }
@@ -1,26 +1,56 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 import sys
 import os
 import base64
+import importlib.util
+from contextlib import contextmanager
 import tempfile
+import time
 from datetime import datetime
 
-# ✅ ARREGLO PARA RENDER:
-sys.path.append('/app')
-sys.path.append('.')
-sys.path.append('..')
-sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
+# encontrarpdf.py y el paquete api viven en la raíz del repo (/app en Render)
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
 
-try:
-    from encontrarpdf import SedapalBuscadorInteractivo
-    print("✅ encontrarpdf.py importado exitosamente")
-except ImportError as e:
-    print(f"❌ ERROR IMPORTANDO encontrarpdf.py: {e}")
-    # Continuar sin crash
-    SedapalBuscadorInteractivo = None
+# encontrarpdf (requests, y Selenium si hace falta Chrome) se importa recién al
+# crear el primer buscador: /api/test y /metrics no lo pagan en un arranque en frío
+_BUSCADOR_CLS = None
+
+def _buscador_cls():
+    """SedapalBuscadorInteractivo, o None si encontrarpdf.py no se puede importar"""
+    global _BUSCADOR_CLS
+    if _BUSCADOR_CLS is None:
+        try:
+            from encontrarpdf import SedapalBuscadorInteractivo
+            _BUSCADOR_CLS = SedapalBuscadorInteractivo
+        except ImportError as e:
+            print(f"❌ ERROR IMPORTANDO encontrarpdf.py: {e}")
+            _BUSCADOR_CLS = False  # no reintentar en cada request
+    return _BUSCADOR_CLS or None
+
+from api.buscador_pool import BuscadorPool
+from flask.json.provider import DefaultJSONProvider
+from api import jsonfast
+from api.compression import compress_flask_response
+from api.metrics import REGISTRY, REQUEST_SECONDS, DRIVER_LAUNCH_SECONDS, UPSTREAM_SECONDS, CONTENT_TYPE
+
+class _FastJSONProvider(DefaultJSONProvider):
+    """jsonify con api.jsonfast (orjson/msgspec si están instalados)"""
+
+    def dumps(self, obj, **kwargs):
+        return jsonfast.dumps_str(obj)
+
+    def loads(self, s, **kwargs):
+        return jsonfast.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(jsonfast.dumps(obj), mimetype=self.mimetype)
 
 app = Flask(__name__)
+app.json = _FastJSONProvider(app)
 CORS(app)
 
 # Credenciales desde variables de entorno
@@ -28,9 +58,79 @@ EMAIL = os.environ.get('SEDAPAL_EMAIL')
 PASSWORD = os.environ.get('SEDAPAL_PASSWORD')
 PORT = int(os.environ.get('PORT', 5000))
 
-print(f"🚀 === RENDER BACKEND REAL INICIANDO ===")
-print(f"🔑 EMAIL configurado: {EMAIL is not None}")
-print(f"🔑 PASSWORD configurado: {PASSWORD is not None}")
+def _nuevo_buscador():
+    """Buscador con sesión iniciada, listo para el pool (Chrome solo si el login HTTP falla)"""
+    cls = _buscador_cls()
+    if cls is None:
+        raise RuntimeError("encontrarpdf.py no se pudo importar")
+    buscador = cls(EMAIL, PASSWORD)
+    inicio = time.time()
+    if not buscador.login_automatico():
+        if buscador.driver:
+            try:
+                buscador.driver.quit()
+            except Exception:
+                pass
+        raise RuntimeError("Error en login REAL - credenciales incorrectas")
+    modo = 'chrome' if buscador.driver else 'http'
+    DRIVER_LAUNCH_SECONDS.observe(time.time() - inicio, mode=modo)
+    print(f"🔐 Buscador listo en {time.time() - inicio:.1f}s ({modo})")
+    return buscador
+
+# ✅ Buscadores con login hecho: cada request solo paga las llamadas a la API
+POOL = BuscadorPool(_nuevo_buscador)
+# en serverless (Vercel) cada arranque en frío pagaría el login: ahí no se precalienta por defecto
+_PREWARM_DEFAULT = '0' if os.environ.get('VERCEL') else '1'
+if EMAIL and PASSWORD and os.environ.get('SEDAPAL_DRIVER_PREWARM', _PREWARM_DEFAULT) == '1':
+    POOL.prewarm()
+
+@contextmanager
+def _buscador_con_listado(suministro):
+    """(buscador, encontrados) del pool con el listado de `suministro` ya pedido.
+
+    Si SEDAPAL falló (token vencido, 401, 5xx) el buscador se descarta y se
+    reintenta una vez con otro; si vuelve a fallar se lanza RuntimeError en
+    vez de responder un listado vacío.
+    """
+    error = None
+    for _ in range(2):
+        with POOL.checkout() as buscador:
+            with UPSTREAM_SECONDS.time(endpoint="listado", page=""):
+                encontrados = buscador.obtener_todos_los_recibos(suministro)
+            if not encontrados:
+                POOL.discard(buscador)
+            error = getattr(buscador, 'ultimo_error', None)
+            if encontrados or not error:
+                yield buscador, encontrados
+                return
+        print(f"🔄 Buscador descartado ({error}), reintentando...")
+    raise RuntimeError(f"SEDAPAL no respondió: {error}")
+
+@app.before_request
+def _inicio_request():
+    g.t0 = time.perf_counter()
+
+@app.after_request
+def _fin_request(response):
+    t0 = getattr(g, 't0', None)
+    if t0 is not None:
+        ruta = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, method=request.method,
+                                route=ruta, status=response.status_code)
+    # el pdf_base64 y los listados comprimen muy bien
+    return compress_flask_response(response, request.headers.get('Accept-Encoding'))
+
+@REGISTRY.collector
+def _pool_samples():
+    st = POOL.stats()
+    yield "sedapal_driver_pool_total", "gauge", "Buscadores vivos en el pool", {}, st["total"]
+    yield "sedapal_driver_pool_idle", "gauge", "Buscadores libres en el pool", {}, st["idle"]
+    yield "sedapal_driver_created_total", "counter", "Buscadores lanzados", {}, st["created"]
+    yield "sedapal_driver_recycled_total", "counter", "Buscadores cerrados y reemplazados", {}, st["recycled"]
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.route('/api/test', methods=['GET'])
 def test():
@@ -39,13 +139,14 @@ def test():
         "message": "🔥 RENDER con DATOS REALES funcionando",
         "timestamp": datetime.now().isoformat(),
         "email_configured": EMAIL is not None,
-        "encontrarpdf_available": SedapalBuscadorInteractivo is not None,
+        # sin importarlo: /api/test no debe cargar requests/Selenium
+        "encontrarpdf_available": _BUSCADOR_CLS is not False and importlib.util.find_spec("encontrarpdf") is not None,
+        "driver_pool": POOL.stats(),
         "backend_type": "REAL_DATA_RENDER"
     })
 
 @app.route('/api/recibos/<suministro>', methods=['GET'])
 def obtener_recibos_reales(suministro):
-    buscador = None
     try:
         print(f"\n🔍 === BÚSQUEDA REAL RENDER ===")
         print(f"📋 Suministro: {suministro}")
@@ -55,56 +156,47 @@ def obtener_recibos_reales(suministro):
             return jsonify({"error": "Credenciales no configuradas en Render"}), 500
         
         # ✅ VERIFICAR SI SE IMPORTÓ
-        if SedapalBuscadorInteractivo is None:
+        if _buscador_cls() is None:
             return jsonify({"error": "encontrarpdf.py no se pudo importar"}), 500
         
-        # Crear buscador con TUS credenciales REALES
-        buscador = SedapalBuscadorInteractivo(EMAIL, PASSWORD)
+        # Buscador del pool: Chrome ya lanzado y login ya hecho
+        print("📋 Obteniendo recibos REALES de SEDAPAL...")
+        with _buscador_con_listado(suministro) as (buscador, encontrados):
+            if not encontrados:
+                return jsonify({"error": f"No se encontraron recibos para suministro {suministro}"}), 404
+            recibos_completos = list(buscador.recibos_completos)
+            
+        # Convertir TUS recibos REALES al formato PWA
+        recibos_para_pwa = []
+        for i, recibo in enumerate(recibos_completos):
+            recibo_pwa = {
+                "recibo": recibo.get('recibo', f'REC-{i+1}'),
+                "color_estado": recibo.get('color_estado', '📄'),
+                "f_fact": recibo.get('f_fact', ''),
+                "vencimiento": recibo.get('vencimiento', ''),
+                "total_fact": str(recibo.get('total_fact', 0)),
+                "periodo": recibo.get('mes', ''),
+                "estado": recibo.get('estado_pago', ''),
+                "nis_rad": int(suministro),
+                "tipo_recibo": "Consumo de agua",
+                "es_deuda": recibo.get('es_deuda', False),
+                "datos_reales": True,  # ✅ 100% REAL
+                "fuente": "RENDER + ENCONTRARPDF.PY - 100% REAL",
+                "index": i + 1
+            }
+            recibos_para_pwa.append(recibo_pwa)
         
-        print("🌐 Configurando navegador para Render...")
-        if not buscador.configurar_driver():
-            return jsonify({"error": "Error configurando navegador en Render"}), 500
+        recibos_para_pwa.reverse()  # Más recientes primero
         
-        print("🔐 Haciendo login REAL a SEDAPAL...")
-        if not buscador.login_automatico():
-            return jsonify({"error": "Error en login REAL - credenciales incorrectas"}), 500
+        print(f"✅ {len(recibos_para_pwa)} recibos REALES obtenidos exitosamente")
         
-        print("📋 Obteniendo recibos REALES de SEDAPAL...")
-        if buscador.obtener_todos_los_recibos(suministro):
-            
-            # Convertir TUS recibos REALES al formato PWA
-            recibos_para_pwa = []
-            for i, recibo in enumerate(buscador.recibos_completos):
-                recibo_pwa = {
-                    "recibo": recibo.get('recibo', f'REC-{i+1}'),
-                    "color_estado": recibo.get('color_estado', '📄'),
-                    "f_fact": recibo.get('f_fact', ''),
-                    "vencimiento": recibo.get('vencimiento', ''),
-                    "total_fact": str(recibo.get('total_fact', 0)),
-                    "periodo": recibo.get('mes', ''),
-                    "estado": recibo.get('estado_pago', ''),
-                    "nis_rad": int(suministro),
-                    "tipo_recibo": "Consumo de agua",
-                    "es_deuda": recibo.get('es_deuda', False),
-                    "datos_reales": True,  # ✅ 100% REAL
-                    "fuente": "RENDER + ENCONTRARPDF.PY - 100% REAL",
-                    "index": i + 1
-                }
-                recibos_para_pwa.append(recibo_pwa)
-            
-            recibos_para_pwa.reverse()  # Más recientes primero
-            
-            print(f"✅ {len(recibos_para_pwa)} recibos REALES obtenidos exitosamente")
-            
-            return jsonify({
-                "success": True,
-                "recibos": recibos_para_pwa,
-                "total": len(recibos_para_pwa),
-                "message": f"✅ {len(recibos_para_pwa)} recibos REALES de SEDAPAL",
-                "fuente": "RENDER REAL DATA"
-            })
-        else:
-            return jsonify({"error": f"No se encontraron recibos para suministro {suministro}"}), 404
+        return jsonify({
+            "success": True,
+            "recibos": recibos_para_pwa,
+            "total": len(recibos_para_pwa),
+            "message": f"✅ {len(recibos_para_pwa)} recibos REALES de SEDAPAL",
+            "fuente": "RENDER REAL DATA"
+        })
             
     except Exception as e:
         print(f"❌ ERROR REAL: {e}")
@@ -115,19 +207,10 @@ def obtener_recibos_reales(suministro):
             "details": "Error obteniendo datos REALES de SEDAPAL",
             "suministro": suministro
         }), 500
-        
-    finally:
-        if buscador and hasattr(buscador, 'driver') and buscador.driver:
-            try:
-                buscador.driver.quit()
-                print("🔒 Navegador cerrado correctamente")
-            except:
-                pass
 
 @app.route('/api/pdf/<suministro>/<recibo_id>', methods=['GET'])
 def descargar_pdf_real_render(suministro, recibo_id):
     """PDF REAL usando encontrarpdf.py en RENDER"""
-    buscador = None
     try:
         print(f"\n📄 === DESCARGA PDF REAL RENDER ===")
         print(f"📋 Suministro: {suministro}")
@@ -136,79 +219,66 @@ def descargar_pdf_real_render(suministro, recibo_id):
         if not EMAIL or not PASSWORD:
             return jsonify({"error": "Credenciales no configuradas"}), 500
         
-        # Mismo código que funciona en local
-        buscador = SedapalBuscadorInteractivo(EMAIL, PASSWORD)
-        
-        if not buscador.configurar_driver():
-            return jsonify({"error": "Error configurando navegador"}), 500
-        
-        if not buscador.login_automatico():
-            return jsonify({"error": "Error en login"}), 500
-        
-        if not buscador.obtener_todos_los_recibos(suministro):
-            return jsonify({"error": "Error obteniendo lista de recibos"}), 500
-        
-        # Buscar el índice correcto del recibo
-        indice_recibo = None
-        for i, recibo in enumerate(buscador.recibos_completos):
-            if str(recibo.get('recibo')) == str(recibo_id):
-                indice_recibo = i + 1
-                break
-        
-        if not indice_recibo:
-            return jsonify({"error": f"Recibo {recibo_id} no encontrado"}), 404
-        
-        # Crear directorio temporal
-        temp_dir = tempfile.mkdtemp()
-        original_dir = os.getcwd()
-        
-        try:
-            os.chdir(temp_dir)
-            print(f"🔄 Descargando PDF REAL usando índice #{indice_recibo}...")
+        # Mismo código que funciona en local, con un buscador del pool
+        with _buscador_con_listado(suministro) as (buscador, encontrados):
+            if not encontrados:
+                return jsonify({"error": "Error obteniendo lista de recibos"}), 500
             
-            # ✅ USAR ENCONTRARPDF.PY REAL
-            resultado = buscador.descargar_pdf_recibo(indice_recibo)
+            # Buscar el índice correcto del recibo
+            indice_recibo = None
+            for i, recibo in enumerate(buscador.recibos_completos):
+                if str(recibo.get('recibo')) == str(recibo_id):
+                    indice_recibo = i + 1
+                    break
             
-            if resultado:
-                # Buscar archivo PDF generado
-                archivos_pdf = [f for f in os.listdir('.') if f.endswith('.pdf')]
+            if not indice_recibo:
+                return jsonify({"error": f"Recibo {recibo_id} no encontrado"}), 404
+            
+            # Crear directorio temporal
+            temp_dir = tempfile.mkdtemp()
+            original_dir = os.getcwd()
+            
+            try:
+                os.chdir(temp_dir)
+                print(f"🔄 Descargando PDF REAL usando índice #{indice_recibo}...")
                 
-                if archivos_pdf:
-                    archivo_pdf = archivos_pdf[0]
-                    
-                    with open(archivo_pdf, 'rb') as f:
-                        pdf_bytes = f.read()
-                        pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+                # ✅ USAR ENCONTRARPDF.PY REAL
+                with UPSTREAM_SECONDS.time(endpoint="recibo-pdf", page=""):
+                    resultado = buscador.descargar_pdf_recibo(indice_recibo)
+                
+                if resultado:
+                    # Buscar archivo PDF generado
+                    archivos_pdf = [f for f in os.listdir('.') if f.endswith('.pdf')]
                     
-                    if len(pdf_bytes) > 5000:  # PDF real
-                        return jsonify({
-                            "success": True,
-                            "pdf_base64": pdf_base64,
-                            "filename": archivo_pdf,
-                            "message": "PDF REAL descargado de SEDAPAL",
-                            "tamaño": len(pdf_bytes),
-                            "fuente": "RENDER + SEDAPAL REAL",
-                            "tipo": "PDF_REAL_SEDAPAL"
-                        })
+                    if archivos_pdf:
+                        archivo_pdf = archivos_pdf[0]
                         
-        finally:
-            os.chdir(original_dir)
-            import shutil
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
+                        with open(archivo_pdf, 'rb') as f:
+                            pdf_bytes = f.read()
+                            pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+                        
+                        if len(pdf_bytes) > 5000:  # PDF real
+                            return jsonify({
+                                "success": True,
+                                "pdf_base64": pdf_base64,
+                                "filename": archivo_pdf,
+                                "message": "PDF REAL descargado de SEDAPAL",
+                                "tamaño": len(pdf_bytes),
+                                "fuente": "RENDER + SEDAPAL REAL",
+                                "tipo": "PDF_REAL_SEDAPAL"
+                            })
+                            
+            finally:
+                os.chdir(original_dir)
+                import shutil
+                try:
+                    shutil.rmtree(temp_dir)
+                except:
+                    pass
                 
     except Exception as e:
         print(f"❌ ERROR PDF: {e}")
         return jsonify({"error": str(e)}), 500
-        
-    finally:
-        if buscador and hasattr(buscador, 'driver') and buscador.driver:
-            try:
-                buscador.driver.quit()
-            except:
-                pass
 
 if __name__ == '__main__':
     print("🔥 === RENDER BACKEND REAL INICIANDO ===")
@@ -0,0 +1,44 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """Coalesce llamadas concurrentes con la misma clave en una sola ejecución.
+
+    El primero que llega (líder) lanza la corrutina como tarea; los demás
+    esperan esa misma tarea y reciben su resultado o su excepción. La tarea
+    corre aparte, así que si el líder se desconecta los demás no se cancelan.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def lead(self, key: Hashable) -> Optional[asyncio.Future]:
+        """Toma la clave a mano: devuelve un Future que el llamador debe resolver,
+        o None si ya hay otra ejecución en curso para esa clave."""
+        if key in self._calls:
+            return None
+        self.leaders += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[key] = fut
+        fut.add_done_callback(lambda f: (self._calls.pop(key, None), f.cancelled() or f.exception()))
+        return fut
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _t: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared}
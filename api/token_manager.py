@@ -0,0 +1,178 @@
+import os, json, asyncio, tempfile, time
+from typing import Awaitable, Callable, Optional, Tuple
+
+from api.cache_backend import CacheBackend, lock_owner
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candado entre procesos
+    fcntl = None
+
+TOKEN_FILE = os.getenv("SEDAPAL_TOKEN_FILE", os.path.join(tempfile.gettempdir(), "sedapal_token.json"))
+REFRESH_MARGIN = int(os.getenv("SEDAPAL_TOKEN_REFRESH_MARGIN", "300"))
+MIN_VALID = 120  # un token con menos vida que esto ya no se usa
+SHARED_KEY = "sedapal:token"
+LOGIN_LOCK_TTL = 60  # el candado de login en el backend compartido se libera solo si el worker muere
+
+
+class TokenManager:
+    """Token de SEDAPAL compartido entre corrutinas y entre workers.
+
+    - Solo un login a la vez: quien pide refresh() con un token viejo espera
+      al login en curso y recibe el token nuevo.
+    - El token vive también en TOKEN_FILE (escritura atómica + flock), así
+      los demás workers lo adoptan en vez de hacer su propio login. Con un
+      backend compartido (api.cache_backend) va ahí, y así lo ven también
+      las otras réplicas.
+    - Una tarea de fondo lo renueva REFRESH_MARGIN segundos antes de `exp`,
+      fuera del camino de las peticiones.
+    """
+
+    def __init__(self, login: Callable[[], Awaitable[Tuple[str, float]]],
+                 path: Optional[str] = TOKEN_FILE, margin: int = REFRESH_MARGIN,
+                 shared: Optional[CacheBackend] = None):
+        self._login = login
+        self.path = path
+        self.shared = shared if shared is not None and shared.shared else None
+        self.margin = margin
+        self.token: Optional[str] = None
+        self.exp: float = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.logins = 0
+        self.adopted = 0
+        self.last_error: Optional[str] = None
+
+    def alive(self) -> bool:
+        return bool(self.token) and time.time() < self.exp - MIN_VALID
+
+    async def get(self) -> str:
+        if self.alive():
+            return self.token
+        return await self.refresh(stale=self.token)
+
+    async def refresh(self, stale: Optional[str] = None) -> str:
+        """Token distinto de `stale`; hace login solo si nadie lo renovó ya."""
+        async with self._lock:
+            if self.token != stale and self.alive():
+                return self.token
+            if await asyncio.to_thread(self._adopt, stale):
+                return self.token
+            lock = await asyncio.to_thread(self._acquire)
+            try:
+                # otro worker pudo renovarlo mientras esperábamos el candado
+                if await asyncio.to_thread(self._adopt, stale):
+                    return self.token
+                token, exp = await self._login()
+                self.logins += 1
+                self.token, self.exp = token, exp
+                await asyncio.to_thread(self._write, token, exp)
+                return token
+            finally:
+                await asyncio.to_thread(self._release, lock)
+
+    def _read(self) -> Optional[dict]:
+        if self.shared:
+            raw = self.shared.get(SHARED_KEY)
+            return json.loads(raw) if raw else None
+        if not self.path:
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _adopt(self, stale: Optional[str]) -> bool:
+        try:
+            data = self._read()
+            if data is None:
+                return False
+            token, exp = data["token"], float(data["exp"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if token == stale or time.time() >= exp - MIN_VALID:
+            return False
+        if token != self.token:
+            self.adopted += 1
+        self.token, self.exp = token, exp
+        return True
+
+    def _write(self, token: str, exp: float):
+        if self.shared:
+            self.shared.set(SHARED_KEY, json.dumps({"token": token, "exp": exp}).encode(),
+                            ttl=max(1, exp - time.time()))
+            return
+        if not self.path:
+            return
+        d = os.path.dirname(self.path) or "."
+        fd, tmp = tempfile.mkstemp(dir=d, prefix=".token-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"token": token, "exp": exp}, f)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def _acquire(self):
+        if self.shared:
+            # SET NX con vencimiento; si el backend falla o no se consigue en LOGIN_LOCK_TTL se sigue igual
+            deadline = time.monotonic() + LOGIN_LOCK_TTL
+            owner = lock_owner()
+            while True:
+                got = self.shared.add(SHARED_KEY + ":lock", owner, LOGIN_LOCK_TTL)
+                if got:
+                    return (SHARED_KEY + ":lock", owner)
+                if got is None or time.monotonic() >= deadline:
+                    return None
+                time.sleep(0.1)
+        if not self.path or fcntl is None:
+            return None
+        try:
+            fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        except OSError:
+            return None
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def _release(self, lock):
+        if isinstance(lock, tuple):
+            self.shared.delete_if(*lock)
+        elif lock is not None:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            os.close(lock)
+
+    async def _run(self):
+        while True:
+            delay = self.exp - self.margin - time.time() if self.token else 0
+            await asyncio.sleep(max(delay, 5))
+            try:
+                await self.refresh(stale=self.token)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                await asyncio.sleep(60)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "alive": self.alive(),
+            "expires_in": max(0, int(self.exp - time.time())) if self.token else None,
+            "logins": self.logins,
+            "adopted": self.adopted,
+            "shared": self.shared.name if self.shared else None,
+            "last_error": self.last_error,
+        }
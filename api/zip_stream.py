@@ -0,0 +1,41 @@
+import time, zipfile
+from typing import AsyncIterator, Tuple
+
+
+class _Sink:
+    """Destino no-seekable para ZipFile: acumula lo escrito hasta drain()."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+async def zip_stream(entries: AsyncIterator[Tuple[str, bytes]]) -> AsyncIterator[bytes]:
+    """ZIP por trozos: cada entrada se emite apenas llega, sin armar el archivo en memoria.
+
+    Los PDFs ya vienen comprimidos, así que se guardan sin recomprimir (ZIP_STORED).
+    """
+    sink = _Sink()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        async for name, data in entries:
+            info = zipfile.ZipInfo(name, date_time)
+            info.external_attr = 0o644 << 16
+            zf.writestr(info, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
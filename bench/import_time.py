@@ -0,0 +1,118 @@
+"""Presupuesto de arranque en frío: cuánto tarda `import api.sedapal` (python -X importtime).
+
+vercel.json manda todo /api/* a api/sedapal.py, así que cada arranque en frío
+paga este import antes del primer pedido. Sale con 1 si se pasa del
+presupuesto, si carga un módulo prohibido (Selenium debe importarse solo al
+lanzar Chrome) o si empeora frente a un baseline guardado.
+
+    python bench/import_time.py                     # presupuesto por defecto de BUDGETS
+    python bench/import_time.py -m api.app --budget-ms 1500
+    python bench/import_time.py --save antes        # guarda bench/baselines/import_antes.json
+    python bench/import_time.py --compare antes     # sale con 1 si empeoró más que --tolerance
+"""
+import argparse, json, os, statistics, subprocess, sys, time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, "bench", "baselines")
+
+# módulo -> (ms acumulados permitidos, módulos que no debe cargar)
+BUDGETS = {
+    "api.sedapal": (400, ("selenium", "encontrarpdf", "requests")),
+    "api.app": (1500, ("selenium", "encontrarpdf")),
+}
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """(ms acumulados del módulo, {módulo cargado: ms propios}) en un intérprete nuevo."""
+    env = dict(os.environ, PYTHONPATH=ROOT, SEDAPAL_DRIVER_PREWARM="0")
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                       cwd=ROOT, env=env, capture_output=True, text=True)
+    if p.returncode != 0:
+        raise SystemExit(f"import {module} falló:\n{p.stderr[-2000:]}")
+    total, own = None, {}
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        own[name] = int(self_us) / 1000
+        if name == module:
+            total = int(cum_us) / 1000
+    if total is None:
+        raise SystemExit(f"{module} no aparece en la salida de -X importtime (¿ya estaba importado?)")
+    return total, own
+
+
+def forbidden(loaded: List[str], forbid) -> List[str]:
+    return sorted({f for f in forbid for m in loaded if m == f or m.startswith(f + ".")})
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Tiempo de import en frío con presupuesto")
+    p.add_argument("-m", "--module", default="api.sedapal")
+    p.add_argument("-r", "--runs", type=int, default=7, help="se toma la mediana")
+    p.add_argument("--budget-ms", type=float, help="por defecto el de BUDGETS")
+    p.add_argument("--forbid", action="append", help="módulo que no debe cargarse (repetible)")
+    p.add_argument("--top", type=int, default=10, help="módulos más caros a mostrar")
+    p.add_argument("--save", metavar="NOMBRE", help="guardar en bench/baselines/import_NOMBRE.json")
+    p.add_argument("--compare", metavar="NOMBRE", help="comparar con bench/baselines/import_NOMBRE.json")
+    p.add_argument("--tolerance", type=float, default=0.15, help="empeoramiento permitido (0.15 = 15%%)")
+    args = p.parse_args(argv)
+
+    budget, forbid = BUDGETS.get(args.module, (None, ()))
+    budget = args.budget_ms if args.budget_ms is not None else budget
+    forbid = tuple(args.forbid) if args.forbid else forbid
+
+    totals, owns = [], {}
+    for _ in range(max(1, args.runs)):
+        total, own = measure(args.module)
+        totals.append(total)
+        for name, ms in own.items():
+            owns.setdefault(name, []).append(ms)
+    total = statistics.median(totals)
+    own = {name: statistics.median(v) for name, v in owns.items()}
+
+    print(f"import {args.module}: {total:.1f} ms (mediana de {len(totals)}, "
+          f"min {min(totals):.1f}, max {max(totals):.1f}), {len(own)} módulos")
+    print(f"\n{'módulo':<40} {'ms propios':>10}")
+    for name, ms in sorted(own.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{name:<40} {ms:>10.1f}")
+
+    ok = True
+    bad = forbidden(list(own), forbid)
+    if bad:
+        ok = False
+        print(f"\nFALLA: {args.module} carga módulos prohibidos: {', '.join(bad)}")
+    if budget is not None:
+        if total > budget:
+            ok = False
+            print(f"\nFALLA: {total:.1f} ms supera el presupuesto de {budget:.0f} ms")
+        else:
+            print(f"\npresupuesto: {total:.1f} / {budget:.0f} ms")
+
+    report = {"module": args.module, "total_ms": round(total, 1),
+              "modules": {k: round(v, 2) for k, v in own.items()},
+              "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    if args.compare:
+        with open(os.path.join(BASELINES, f"import_{args.compare}.json")) as f:
+            base = json.load(f)
+        change = total / base["total_ms"] - 1 if base["total_ms"] else 0.0
+        print(f"baseline {args.compare}: {base['total_ms']:.1f} ms -> {total:.1f} ms ({change:+.0%})")
+        new = sorted(set(own) - set(base.get("modules", {})))
+        if new:
+            print(f"módulos nuevos: {', '.join(new[:20])}" + (" ..." if len(new) > 20 else ""))
+        if change > args.tolerance:
+            ok = False
+            print(f"FALLA: empeoró más de {args.tolerance:.0%}")
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        path = os.path.join(BASELINES, f"import_{args.save}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"guardado en {path}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""CPU por petición de cada backend de api.jsonfast frente a la stdlib.
+
+Mide lo que hace el backend en cada pedido típico: decodificar una página de
+pagados y una respuesta de recibo-pdf de SEDAPAL, y serializar la respuesta
+de /api/recibos/{nis}.
+
+    python bench/json_codec.py --pdf-kb 300 --items 42
+"""
+import argparse, base64, json, os, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from api import jsonfast  # noqa: E402
+from stub_sedapal import _recibo  # noqa: E402
+
+
+def _codecs():
+    out = {"json": jsonfast._stdlib()}
+    for name, make in (("orjson", jsonfast._orjson), ("msgspec", jsonfast._msgspec)):
+        try:
+            out[name] = make()
+        except (ImportError, TypeError):
+            pass
+    return out
+
+
+def _cpu_us(fn, payload, min_time: float) -> float:
+    """µs de CPU por llamada (process_time), midiendo unos min_time segundos."""
+    reps = 1
+    while True:  # calibra (y calienta) duplicando hasta que una tanda dure min_time / 10
+        t0 = time.process_time()
+        for _ in range(reps):
+            fn(payload)
+        spent = time.process_time() - t0
+        if spent >= min_time / 10:
+            break
+        reps *= 2
+    reps = max(1, int(reps * min_time / spent))
+    t0 = time.process_time()
+    for _ in range(reps):
+        fn(payload)
+    return (time.process_time() - t0) / reps * 1e6
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark de api.jsonfast")
+    p.add_argument("--pdf-kb", type=int, default=200, help="tamaño del PDF antes de base64")
+    p.add_argument("--items", type=int, default=42, help="recibos por página de SEDAPAL")
+    p.add_argument("--min-time", type=float, default=0.5, help="segundos de CPU por medición")
+    args = p.parse_args(argv)
+
+    page = json.dumps({"bRESP": [_recibo(4242, i, "COBRADO") for i in range(args.items)]}).encode()
+    pdf = json.dumps({"bRESP": base64.b64encode(os.urandom(args.pdf_kb * 1024)).decode()}).encode()
+    listing = {"ok": True, "total": 30, "items": [_recibo(4242, i, "COBRADO") for i in range(30)],
+               "source": "SEDAPAL_HTTP"}
+    cases = (
+        (f"decode página ({len(page) // 1024} KB)", "loads", page),
+        (f"decode recibo-pdf ({len(pdf) // 1024} KB)", "loads", pdf),
+        ("encode /api/recibos (30)", "dumps", listing),
+    )
+
+    codecs = _codecs()
+    print(f"backend activo: {jsonfast.BACKEND}\n")
+    print(f"{'caso':<28}" + "".join(f"{n:>12}" for n in codecs) + f"{'ahorro':>10}")
+    for label, op, payload in cases:
+        times = {}
+        for name, (_, dumps, _, loads) in codecs.items():
+            times[name] = _cpu_us(loads if op == "loads" else dumps, payload, args.min_time)
+        best = min(times.values())
+        print(f"{label:<28}" + "".join(f"{times[n]:>10.1f}µs" for n in codecs)
+              + f"{1 - best / times['json']:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
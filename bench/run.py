@@ -0,0 +1,354 @@
+"""Benchmark del backend contra bench/stub_sedapal.py.
+
+Levanta el stub y el backend (uvicorn api.app por defecto; `--backend flask`
+para api/sedapal.py si selenium está instalado) en puertos locales, corre los
+escenarios y reporta throughput, p50/p95/p99, pico de RSS del backend y
+llamadas que llegaron al stub.
+
+    python bench/run.py                          # todos los escenarios
+    python bench/run.py -s hot -s pdf_burst --latency 300
+    python bench/run.py --save antes             # guarda bench/baselines/antes.json
+    python bench/run.py --compare antes          # compara y sale con 1 si empeoró
+
+Escenarios:
+    hot        mismo NIS una y otra vez (caché caliente)
+    cold       un NIS nuevo por petición (listado completo contra SEDAPAL)
+    pdf_burst  ráfaga de PDFs de un mismo NIS, varios clientes pidiendo los mismos
+    many_nis   mezcla de listados sobre muchos NIS, con sesgo hacia unos pocos
+"""
+import argparse, asyncio, json, os, random, shutil, signal, socket, subprocess, sys, tempfile, time
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, "bench", "baselines")
+SCENARIOS = ("hot", "cold", "pdf_burst", "many_nis")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _tree_pids(pid: int) -> List[int]:
+    """pid y sus descendientes (workers de uvicorn/gunicorn)."""
+    out, todo = [], [pid]
+    while todo:
+        p = todo.pop()
+        out.append(p)
+        try:
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                todo.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return out
+
+
+def _status_kb(pid: int, field: str) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Muestrea la RSS sumada del árbol de procesos; VmHWM por si el muestreo se pierde un pico."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            self.peak_kb = max(self.peak_kb, sum(_status_kb(p, "VmRSS") for p in _tree_pids(self.pid)))
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak_kb = 0
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> Dict[str, float]:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        hwm = max((_status_kb(p, "VmHWM") for p in _tree_pids(self.pid)), default=0)
+        return {"rss_peak_mb": round(self.peak_kb / 1024, 1), "vmhwm_mb": round(hwm / 1024, 1)}
+
+
+def _pct(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+
+async def _load(client: httpx.AsyncClient, urls: List[str], concurrency: int) -> Dict[str, float]:
+    """Pide todas las URLs con `concurrency` clientes; latencias en ms."""
+    lat: List[float] = []
+    errors = 0
+    it = iter(urls)
+
+    async def worker():
+        nonlocal errors
+        for url in it:
+            t0 = time.perf_counter()
+            try:
+                r = await client.get(url)
+                await r.aread()
+                if r.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    lat.sort()
+    return {
+        "requests": len(lat),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(lat) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_pct(lat, 0.50), 1),
+        "p95_ms": round(_pct(lat, 0.95), 1),
+        "p99_ms": round(_pct(lat, 0.99), 1),
+        "max_ms": round(lat[-1], 1) if lat else 0.0,
+    }
+
+
+def _items(payload: dict) -> List[dict]:
+    # FastAPI devuelve "items"; el backend Flask, "recibos"
+    return payload.get("items") or payload.get("recibos") or []
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.tmp = tempfile.mkdtemp(prefix="sedapal-bench-")
+        self.stub_port = _free_port()
+        self.app_port = _free_port()
+        self.stub_url = f"http://127.0.0.1:{self.stub_port}"
+        self.app_url = f"http://127.0.0.1:{self.app_port}"
+        self.procs: List[subprocess.Popen] = []
+        self.app: Optional[subprocess.Popen] = None
+        self._nis = args.nis_base
+
+    def _spawn(self, cmd: List[str], env: Dict[str, str], name: str) -> subprocess.Popen:
+        log = open(os.path.join(self.tmp, f"{name}.log"), "wb")
+        p = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                             start_new_session=True)
+        self.procs.append(p)
+        return p
+
+    def start(self):
+        a = self.args
+        env = dict(os.environ)
+        self._spawn([sys.executable, os.path.join("bench", "stub_sedapal.py"),
+                     "--port", str(self.stub_port), "--latency", str(a.latency), "--jitter", str(a.jitter),
+                     "--pagados", str(a.pagados), "--pdf-kb", str(a.pdf_kb)], env, "stub")
+
+        env.update({
+            "PYTHONPATH": ROOT,
+            "SEDAPAL_BASE": f"{self.stub_url}/OficinaComercialVirtual/api",
+            "SEDAPAL_USER": "bench", "SEDAPAL_PASS": "bench",
+            "SEDAPAL_EMAIL": "bench", "SEDAPAL_PASSWORD": "bench",
+            "SEDAPAL_LOGIN_APP_AUTH": "Basic YmVuY2g6YmVuY2g=",
+            "SEDAPAL_TOKEN_FILE": os.path.join(self.tmp, "token.json"),
+            "SEDAPAL_DB": os.path.join(self.tmp, "recibos.db"),
+            "SEDAPAL_PDF_DIR": os.path.join(self.tmp, "pdfs"),
+            "PORT": str(self.app_port),
+        })
+        if a.cache_backend == "sqlite":
+            env["SEDAPAL_CACHE_BACKEND"] = "sqlite:///" + os.path.join(self.tmp, "cache.db")
+        else:
+            env["SEDAPAL_CACHE_BACKEND"] = a.cache_backend
+        if a.backend == "fastapi":
+            cmd = [sys.executable, "-m", "uvicorn", "api.app:app", "--host", "127.0.0.1",
+                   "--port", str(self.app_port), "--workers", str(a.workers), "--log-level", "warning"]
+        else:
+            env["SEDAPAL_DRIVER_PREWARM"] = "1"
+            cmd = [sys.executable, os.path.join("api", "sedapal.py")]
+        self.app = self._spawn(cmd, env, "backend")
+        self._wait(f"{self.stub_url}/stats")
+        self._wait(f"{self.app_url}/api/test")
+
+    def _wait(self, url: str, timeout: float = 60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if any(p.poll() is not None for p in self.procs):
+                break
+            try:
+                if httpx.get(url, timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise SystemExit(f"{url} no respondió; ver logs en {self.tmp}")
+
+    def stop(self):
+        for p in self.procs:
+            if p.poll() is None:
+                os.killpg(p.pid, signal.SIGTERM)
+        for p in self.procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                os.killpg(p.pid, signal.SIGKILL)
+        if not self.args.keep:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def fresh_nis(self) -> int:
+        self._nis += 1
+        return self._nis
+
+    async def upstream_calls(self, client: httpx.AsyncClient, reset: bool = False) -> Dict[str, int]:
+        if reset:
+            await client.post(f"{self.stub_url}/stats/reset")
+            return {}
+        return (await client.get(f"{self.stub_url}/stats")).json()
+
+    async def scenario_urls(self, name: str, client: httpx.AsyncClient) -> List[str]:
+        a = self.args
+        base = f"{self.app_url}/api/recibos"
+        if name == "hot":
+            nis = self.fresh_nis()
+            await client.get(f"{base}/{nis}")  # calienta
+            return [f"{base}/{nis}"] * a.requests
+        if name == "cold":
+            return [f"{base}/{self.fresh_nis()}" for _ in range(a.requests)]
+        if name == "pdf_burst":
+            nis = self.fresh_nis()
+            items = _items((await client.get(f"{base}/{nis}")).json())[: a.pdfs]
+            if not items:
+                raise SystemExit("pdf_burst: el listado vino vacío")
+            urls = [f"{self.app_url}/api/pdf/{nis}/{it['recibo']}" for it in items]
+            # cada PDF lo piden varios clientes a la vez
+            return [urls[i % len(urls)] for i in range(a.requests)]
+        if name == "many_nis":
+            pool = [self.fresh_nis() for _ in range(a.nis_pool)]
+            rnd = random.Random(42)
+            weights = [1 / (i + 1) for i in range(len(pool))]  # zipf-ish
+            return [f"{base}/{n}" for n in rnd.choices(pool, weights=weights, k=a.requests)]
+        raise SystemExit(f"escenario desconocido: {name}")
+
+    async def run(self) -> Dict[str, dict]:
+        results = {}
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2)
+        async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+            for name in self.args.scenario or SCENARIOS:
+                urls = await self.scenario_urls(name, client)
+                await self.upstream_calls(client, reset=True)
+                rss = RssSampler(self.app.pid)
+                rss.start()
+                res = await _load(client, urls, self.args.concurrency)
+                res.update(await rss.stop())
+                res["upstream"] = await self.upstream_calls(client)
+                res["upstream_total"] = sum(res["upstream"].values())
+                results[name] = res
+                _print_row(name, res)
+        return results
+
+
+COLUMNS = ("requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms", "rss_peak_mb", "upstream_total")
+
+
+def _print_header():
+    print(f"{'escenario':<10} " + " ".join(f"{c:>14}" for c in COLUMNS), flush=True)
+
+
+def _print_row(name: str, res: dict):
+    print(f"{name:<10} " + " ".join(f"{res.get(c, ''):>14}" for c in COLUMNS), flush=True)
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> bool:
+    """Imprime la comparación; False si algún escenario empeoró más que `tolerance`."""
+    ok = True
+    print(f"\n{'escenario':<10} {'métrica':<14} {'base':>12} {'ahora':>12} {'cambio':>9}")
+    # más alto es mejor solo para rps
+    checks = (("rps", -1), ("p50_ms", 1), ("p95_ms", 1), ("p99_ms", 1), ("rss_peak_mb", 1), ("upstream_total", 1))
+    for name, res in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, sign in checks:
+            b, c = base.get(metric), res.get(metric)
+            if not b or c is None:
+                continue
+            delta = (c - b) / b
+            worse = sign * delta > tolerance
+            ok = ok and not worse
+            print(f"{name:<10} {metric:<14} {b:>12} {c:>12} {delta:>+8.0%}{'  <-- peor' if worse else ''}")
+    return ok
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark del backend SEDAPAL contra un stub local")
+    p.add_argument("-s", "--scenario", action="append", choices=SCENARIOS)
+    p.add_argument("--backend", choices=("fastapi", "flask"), default="fastapi")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--cache-backend", default="memory",
+                   help="memory, sqlite (en el directorio temporal) o una URL redis://")
+    p.add_argument("-n", "--requests", type=int, default=400)
+    p.add_argument("-c", "--concurrency", type=int, default=32)
+    p.add_argument("--pdfs", type=int, default=8, help="PDFs distintos en pdf_burst")
+    p.add_argument("--nis-pool", type=int, default=50, help="NIS distintos en many_nis")
+    p.add_argument("--nis-base", type=int, default=int(time.time()) % 1000000 * 10)
+    p.add_argument("--latency", type=float, default=150, help="ms del stub por llamada")
+    p.add_argument("--jitter", type=float, default=50)
+    p.add_argument("--pagados", type=int, default=60)
+    p.add_argument("--pdf-kb", type=int, default=120)
+    p.add_argument("--save", metavar="NOMBRE", help="guardar resultados en bench/baselines/NOMBRE.json")
+    p.add_argument("--compare", metavar="NOMBRE", help="comparar con bench/baselines/NOMBRE.json")
+    p.add_argument("--tolerance", type=float, default=0.15, help="empeoramiento permitido (0.15 = 15%%)")
+    p.add_argument("--keep", action="store_true", help="no borrar el directorio temporal (logs, SQLite, PDFs)")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    bench = Bench(args)
+    bench.start()
+    try:
+        _print_header()
+        results = asyncio.run(bench.run())
+    finally:
+        bench.stop()
+
+    report = {
+        "backend": args.backend,
+        "config": {k: getattr(args, k) for k in ("workers", "requests", "concurrency", "latency",
+                                                  "jitter", "pagados", "pdf_kb", "pdfs", "nis_pool",
+                                                  "cache_backend")},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "scenarios": results,
+    }
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        path = os.path.join(BASELINES, f"{args.save}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\nbaseline guardado en {os.path.relpath(path, ROOT)}")
+    if args.compare:
+        with open(os.path.join(BASELINES, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("\naviso: la configuración difiere del baseline, la comparación es orientativa")
+        if not compare(results, baseline.get("scenarios", {}), args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
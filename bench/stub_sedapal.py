@@ -0,0 +1,172 @@
+"""Servidor falso de SEDAPAL para benchmarks (solo stdlib).
+
+Imita /login, lista-recibos-deudas-nis, lista-recibos-pagados-nis (paginado)
+y recibo-pdf (PDF en base64) bajo /OficinaComercialVirtual/api. Los datos
+son deterministas por NIS, así los ETag no cambian entre corridas.
+
+    python bench/stub_sedapal.py --port 8700 --latency 150 --pagados 60 --pdf-kb 120
+
+GET /stats devuelve cuántas llamadas recibió cada endpoint (POST /stats/reset las pone a cero).
+"""
+import argparse, base64, hashlib, json, random, threading, time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "/OficinaComercialVirtual/api"
+
+
+def _jwt(exp: int) -> str:
+    enc = lambda d: base64.urlsafe_b64encode(json.dumps(d).encode()).decode().rstrip("=")
+    return f"{enc({'alg': 'none'})}.{enc({'sub': 'bench', 'exp': exp})}.firma"
+
+
+def _recibo(nis: int, i: int, estado: str) -> dict:
+    """i = 0 es el mes más reciente."""
+    f = date.today().replace(day=1) - timedelta(days=30 * i)
+    return {
+        "recibo": f"{nis % 100000:05d}{i:04d}",
+        "nis_rad": nis,
+        "sec_nis": 1,
+        "sec_rec": 1000 - i,
+        "cod_cli": nis,
+        "f_fact": f.isoformat(),
+        "vencimiento": (f + timedelta(days=20)).isoformat(),
+        "mes": f.strftime("%Y-%m"),
+        "total_fact": round(20 + (nis * 7 + i * 13) % 180 + 0.5, 2),
+        "estado": estado,
+        "est_rec": "EP010" if estado == "PENDIENTE" else "EP020",
+        "tipo_recibo": "Consumo de agua",
+        "volumen": (nis + i) % 40,
+    }
+
+
+class Stub:
+    def __init__(self, args):
+        self.args = args
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._pdf = {}
+
+    def count(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def sleep(self, factor: float = 1.0):
+        ms = self.args.latency * factor
+        if self.args.jitter:
+            ms += random.uniform(0, self.args.jitter)
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def pdf_b64(self, nis: int, sec_rec: int) -> str:
+        key = (nis, sec_rec)
+        blob = self._pdf.get(key)
+        if blob is None:
+            seed = hashlib.sha256(f"{nis}-{sec_rec}".encode()).digest()
+            body = (seed * (self.args.pdf_kb * 1024 // len(seed) + 1))[: self.args.pdf_kb * 1024]
+            pdf = b"%PDF-1.4\n%bench\n" + body + b"\n%%EOF\n"
+            blob = self._pdf[key] = base64.b64encode(pdf).decode()
+        return blob
+
+
+def make_handler(stub: Stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *a):
+            pass
+
+        def _send(self, status: int, payload):
+            raw = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _body(self) -> bytes:
+            n = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(n) if n else b""
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with stub._lock:
+                    return self._send(200, dict(stub.calls))
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            raw = self._body()
+            if self.path == "/stats/reset":
+                with stub._lock:
+                    stub.calls.clear()
+                return self._send(200, {"ok": True})
+            if not self.path.startswith(PREFIX):
+                return self._send(404, {"error": "not found"})
+            path = self.path[len(PREFIX):]
+            a = stub.args
+
+            if path == "/login":
+                stub.count("login")
+                stub.sleep(2)
+                return self._send(200, {"bRESP": {"token": _jwt(int(time.time()) + a.token_ttl)}})
+
+            if not (self.headers.get("Authorization") or self.headers.get("X-Auth-Token")):
+                return self._send(401, {"error": "sin token"})
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                return self._send(400, {"error": "json"})
+            nis = int(body.get("nis_rad") or 0)
+
+            if path == "/recibos/lista-recibos-deudas-nis":
+                stub.count("deudas")
+                stub.sleep()
+                return self._send(200, {"bRESP": [_recibo(nis, i, "PENDIENTE") for i in range(a.deudas)]})
+
+            if path == "/recibos/lista-recibos-pagados-nis":
+                page = int(body.get("page_num") or 1)
+                size = int(body.get("page_size") or 10)
+                stub.count(f"pagados_p{page}")
+                stub.sleep()
+                lo = a.deudas + (page - 1) * size
+                hi = min(a.deudas + a.pagados, lo + size)
+                return self._send(200, {"bRESP": [_recibo(nis, i, "PAGADO") for i in range(lo, hi)]})
+
+            if path == "/recibos/recibo-pdf":
+                stub.count("recibo-pdf")
+                stub.sleep(a.pdf_latency_factor)
+                blob = stub.pdf_b64(nis, int(body.get("sec_rec") or 0))
+                return self._send(200, ('{"bRESP":"%s"}' % blob).encode())
+
+            self._send(404, {"error": "not found"})
+
+    return Handler
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8700)
+    p.add_argument("--latency", type=float, default=150, help="ms por llamada")
+    p.add_argument("--jitter", type=float, default=50, help="ms aleatorios extra (0..jitter)")
+    p.add_argument("--pdf-latency-factor", type=float, default=2.0, help="recibo-pdf tarda latency * factor")
+    p.add_argument("--deudas", type=int, default=2, help="recibos pendientes por NIS")
+    p.add_argument("--pagados", type=int, default=60, help="recibos pagados por NIS (define cuántas páginas hay)")
+    p.add_argument("--pdf-kb", type=int, default=120)
+    p.add_argument("--token-ttl", type=int, default=3600)
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(Stub(args)))
+    server.daemon_threads = True
+    print(f"stub SEDAPAL en http://{args.host}:{args.port}{PREFIX}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -9,18 +9,26 @@ SEDAPAL BUSCADOR INTERACTIVO - VERSIÓN RENDER FINAL
 import requests
 import json
 import time
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 from datetime import datetime   
 import os
 import sys
 
 sys.path.append('/app')
 
+webdriver = By = WebDriverWait = EC = Options = Service = None
+
+def _cargar_selenium():
+    """Importa Selenium recién cuando hace falta Chrome (el login HTTP no lo usa)"""
+    global webdriver, By, WebDriverWait, EC, Options, Service
+    if webdriver is not None:
+        return
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
 class SedapalBuscadorInteractivo:
     def __init__(self, email, password):
         self.email = email
@@ -28,9 +36,10 @@ class SedapalBuscadorInteractivo:
         self.sedtoken = None
         self.driver = None
         self.recibos_completos = []
+        self.ultimo_error = None  # p.ej. "deudas: 401"; el pool descarta el buscador y se reintenta
         
         # APIs
-        self.base_url = "https://webapp16.sedapal.com.pe/OficinaComercialVirtual/api"
+        self.base_url = os.environ.get("SEDAPAL_BASE", "https://webapp16.sedapal.com.pe/OficinaComercialVirtual/api").rstrip("/")
         self.endpoints = {
             'recibos_deuda': f"{self.base_url}/recibos/lista-recibos-deudas-nis",
             'recibos_pagados': f"{self.base_url}/recibos/lista-recibos-pagados-nis",
@@ -46,6 +55,7 @@ class SedapalBuscadorInteractivo:
         """Configurar driver de Chrome para RENDER - FINAL SIN ERRORES"""
         try:
             print("🌐 Configurando Chrome para Render...")
+            _cargar_selenium()
             
             chrome_options = Options()
             chrome_options.add_argument('--headless')
@@ -170,10 +180,49 @@ class SedapalBuscadorInteractivo:
             traceback.print_exc()
             return False
     
+    def login_http(self):
+        """Login directo contra /login por HTTP, sin navegador"""
+        app_auth = os.environ.get('SEDAPAL_LOGIN_APP_AUTH')
+        if not app_auth:
+            return False
+        try:
+            print("⚡ Login HTTP directo...")
+            headers = {
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Authorization": app_auth,
+                "Accept": "application/json, text/plain, */*",
+                "Origin": "https://webapp16.sedapal.com.pe",
+                "Referer": "https://webapp16.sedapal.com.pe/socv/",
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+            }
+            response = requests.post(
+                f"{self.base_url}/login",
+                headers=headers,
+                data={"username": self.email, "password": self.password},
+                timeout=20
+            )
+            if response.status_code == 200:
+                token = (response.json() or {}).get('bRESP', {}).get('token')
+                if token:
+                    self.sedtoken = token
+                    print("✅ Login HTTP exitoso - Token obtenido")
+                    return True
+            print(f"⚠️ Login HTTP sin token ({response.status_code})")
+        except Exception as e:
+            print(f"⚠️ Error en login HTTP: {e}")
+        return False
+    
     def login_automatico(self):
-        """Login y obtención del token"""
+        """Login y obtención del token (HTTP primero, Selenium como respaldo)"""
+        # ✅ Camino rápido: sin Chrome
+        if self.login_http():
+            return True
+        
         try:
-            print("🔑 Haciendo login a SEDAPAL...")
+            print("🔑 Haciendo login a SEDAPAL con navegador...")
+            
+            if not self.driver and not self.configurar_driver():
+                return False
             
             # Ir a login
             self.driver.get("https://webapp16.sedapal.com.pe/socv/#/iniciar-sesion")
@@ -243,6 +292,7 @@ class SedapalBuscadorInteractivo:
             
             todos_los_recibos = []
             nis_rad_correcto = int(nis_buscar)
+            self.ultimo_error = None
             
             # 1. Obtener recibos de DEUDA
             print("📄 Obteniendo recibos pendientes...")
@@ -274,8 +324,10 @@ class SedapalBuscadorInteractivo:
                     print(f"   ✅ {len(recibos_deuda)} recibos pendientes")
                 else:
                     print(f"   ⚠️ Error obteniendo deudas: {response_deuda.status_code}")
+                    self.ultimo_error = f"deudas: {response_deuda.status_code}"
             except Exception as e:
                 print(f"   ⚠️ Error en recibos deuda: {e}")
+                self.ultimo_error = f"deudas: {e}"
             
             # 2. Obtener recibos PAGADOS
             print("✅ Obteniendo recibos pagados...")
@@ -322,14 +374,21 @@ class SedapalBuscadorInteractivo:
                         pagina += 1
                     else:
                         print(f"   ⚠️ Error página {pagina}: {response_pagados.status_code}")
+                        self.ultimo_error = f"pagados página {pagina}: {response_pagados.status_code}"
                         break
                         
                 except Exception as e:
                     print(f"   ⚠️ Error página {pagina}: {e}")
+                    self.ultimo_error = f"pagados página {pagina}: {e}"
                     break
             
             print(f"   ✅ {total_pagados} recibos pagados total")
             
+            # un 401 (token vencido) o un error de SEDAPAL no es "sin recibos"
+            if self.ultimo_error:
+                print(f"❌ Listado incompleto: {self.ultimo_error}")
+                return False
+            
             # 3. Ordenar por fecha
             print("🔄 Ordenando recibos por fecha...")
             
@@ -356,6 +415,7 @@ class SedapalBuscadorInteractivo:
             
         except Exception as e:
             print(f"❌ Error obteniendo recibos: {e}")
+            self.ultimo_error = str(e)
             import traceback
             traceback.print_exc()
             return False
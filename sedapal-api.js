@@ -20,7 +20,7 @@ class SedapalAPISimple {
     try {
       const clean = String(nis).replace(/\D+/g, '');
       console.log(`🔍 Buscando recibos REALES: ${clean}`);
-      const r = await fetch(`${this.pythonURL}/api/recibos/${clean}?t=${Date.now()}`, { cache: 'no-store' });
+      const r = await fetch(`${this.pythonURL}/api/recibos/${clean}`, { cache: 'no-cache' });
 
       if (!r.ok) {
         const txt = await r.text().catch(()=>'');
@@ -85,7 +85,7 @@ async descargarPDF(recibo) {
       // Intenta recuperar el NIS del recibo, o del input de búsqueda si lo tienes global
       nis = recibo.nis || recibo.suministro || prompt("Ingrese el NIS original para este recibo:");
     }
-    const r = await fetch(`${this.pythonURL}/api/pdf/${nis}/${recibo.recibo}`, { cache: 'no-store' });
+    const r = await fetch(`${this.pythonURL}/api/pdf/${nis}/${recibo.recibo}`, { cache: 'no-cache' });
     if (!r.ok) throw new Error(`HTTP ${r.status}`);
     const blob = await r.blob();
     const url = URL.createObjectURL(blob);
@@ -0,0 +1,43 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api import http_sedapal
+from api.cache import TTLCache
+from api.pdf_store import PdfStore
+from api.recibos_store import ReciboStore
+
+
+def _fresh(cache: TTLCache) -> TTLCache:
+    return TTLCache(cache.name, cache.maxsize, cache.ttl, cache.max_bytes, cache.sizeof)
+
+
+@pytest.fixture
+def sedapal_client(tmp_path, monkeypatch):
+    """Fábrica de AsyncSedapalHTTP contra un MockTransport(handler), con token falso.
+
+    Cada test tiene sus cachés de módulo vacías y sus almacenes (SQLite y PDFs) en tmp_path.
+    """
+    for name in ("_HISTORY", "_RECIBO_INDEX"):
+        monkeypatch.setattr(http_sedapal, name, _fresh(getattr(http_sedapal, name)))
+    for shared in (http_sedapal._RECIBOS_CACHE, http_sedapal._PDF_CACHE):
+        monkeypatch.setattr(shared, "local", _fresh(shared.local))
+    clients = []
+
+    def make(handler) -> http_sedapal.AsyncSedapalHTTP:
+        c = http_sedapal.AsyncSedapalHTTP()
+        c.s = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        async def token():
+            return "token"
+
+        c.tokens.get = token
+        c.store = ReciboStore(str(tmp_path / "recibos.db"))
+        c.pdf_store = PdfStore(str(tmp_path / "pdfs"), 10 * 1024 * 1024)
+        clients.append(c)
+        return c
+
+    yield make
+    for c in clients:
+        asyncio.run(c.aclose())
@@ -0,0 +1,19 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from api import app as app_module, http_sedapal
+from api.recibo import Recibo
+
+
+def test_batch_acepta_nis_numericos(monkeypatch):
+    async def fetch(nis):
+        items = [Recibo.from_upstream({"recibo": str(nis), "f_fact": "2024-01-01"})]
+        return http_sedapal._listing_entry(items, time.time())
+
+    monkeypatch.setattr(app_module.client, "fetch_recibos_entry", fetch)
+    r = TestClient(app_module.app).post("/api/recibos/batch", json={"nis": [1234567, "7654-321", "x"]})
+    assert r.status_code == 200
+    res = r.json()["results"]
+    assert [x["nis"] for x in res[:2]] == [1234567, 7654321]
+    assert res[0]["ok"] and res[1]["ok"] and not res[2]["ok"]
@@ -0,0 +1,74 @@
+import base64, json, time
+
+from api.buscador_pool import BuscadorPool
+
+
+def _jwt(exp: float) -> str:
+    enc = lambda d: base64.urlsafe_b64encode(json.dumps(d).encode()).decode().rstrip("=")
+    return f"{enc({'alg': 'none'})}.{enc({'exp': int(exp)})}.firma"
+
+
+class Buscador:
+    def __init__(self, token, respuestas=None):
+        self.sedtoken = token
+        self.driver = None
+        self.ultimo_error = None
+        self.recibos_completos = []
+        self._respuestas = list(respuestas or [])
+
+    def obtener_todos_los_recibos(self, nis):
+        ok, error, recibos = self._respuestas.pop(0)
+        self.ultimo_error, self.recibos_completos = error, recibos
+        return ok
+
+
+def test_token_por_vencer_no_se_presta():
+    tokens = iter([_jwt(time.time() + 60), _jwt(time.time() + 3600)])
+    pool = BuscadorPool(lambda: Buscador(next(tokens)), size=1)
+    with pool.checkout() as b:
+        viejo = b
+    with pool.checkout() as b:
+        assert b is not viejo
+        assert pool.recycled == 1
+
+
+def test_token_vigente_se_reusa():
+    pool = BuscadorPool(lambda: Buscador(_jwt(time.time() + 3600)), size=1)
+    with pool.checkout() as b:
+        primero = b
+    with pool.checkout() as b:
+        assert b is primero
+
+
+def test_401_descarta_y_reintenta(monkeypatch):
+    from api import sedapal
+
+    recibo = {"recibo": "1", "f_fact": "2024-01-01", "mes": "2024-01", "total_fact": 10}
+    buscadores = iter([
+        Buscador(_jwt(time.time() + 3600), [(False, "deudas: 401", [])]),
+        Buscador(_jwt(time.time() + 3600), [(True, None, [recibo])]),
+    ])
+    pool = BuscadorPool(lambda: next(buscadores), size=1)
+    monkeypatch.setattr(sedapal, "POOL", pool)
+    monkeypatch.setattr(sedapal, "EMAIL", "x")
+    monkeypatch.setattr(sedapal, "PASSWORD", "y")
+    monkeypatch.setattr(sedapal, "_buscador_cls", lambda: Buscador)
+
+    r = sedapal.app.test_client().get("/api/recibos/123")
+    assert r.status_code == 200
+    assert r.get_json()["total"] == 1
+    assert pool.created == 2 and pool.recycled == 1
+
+
+def test_error_persistente_no_es_listado_vacio(monkeypatch):
+    from api import sedapal
+
+    pool = BuscadorPool(lambda: Buscador(None, [(False, "deudas: 500", [])]), size=1)
+    monkeypatch.setattr(sedapal, "POOL", pool)
+    monkeypatch.setattr(sedapal, "EMAIL", "x")
+    monkeypatch.setattr(sedapal, "PASSWORD", "y")
+    monkeypatch.setattr(sedapal, "_buscador_cls", lambda: Buscador)
+
+    r = sedapal.app.test_client().get("/api/recibos/123")
+    assert r.status_code == 500
+    assert "deudas: 500" in r.get_json()["error"]
@@ -0,0 +1,50 @@
+import time
+
+from api import cache
+from api.cache import TTLCache
+
+
+def test_lru_desaloja_el_menos_usado():
+    c = TTLCache("t", maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.get("b") is None and c.get("a") == 1 and c.get("c") == 3
+    assert c.evictions == 1
+
+
+def test_presupuesto_de_bytes():
+    c = TTLCache("t", maxsize=100, ttl=60, max_bytes=10, sizeof=len)
+    c.set("a", b"12345")
+    c.set("b", b"12345")
+    c.set("c", b"123")
+    assert c.get("a") is None and c.bytes == 8
+
+
+def test_valor_mas_grande_que_el_presupuesto_borra_el_anterior():
+    c = TTLCache("t", maxsize=100, ttl=60, max_bytes=10, sizeof=len)
+    c.set("a", b"viejo")
+    c.set("a", b"x" * 11)
+    assert c.get("a") is None and c.bytes == 0
+
+
+def test_ttl_por_entrada():
+    c = TTLCache("t", maxsize=10, ttl=60)
+    c.set("corto", 1, ttl=0.01)
+    c.set("largo", 2)
+    time.sleep(0.02)
+    assert c.get("corto") is None and c.get("largo") == 2
+    assert c.expirations == 1
+
+
+def test_sweeper_purga_lo_vencido(monkeypatch):
+    c = TTLCache("t", maxsize=10, ttl=0.01)
+    c.set("a", 1)
+    c.set("b", 2, ttl=60)
+    monkeypatch.setattr(cache, "_SWEEPER", None)
+    cache.start_sweeper(0.05)
+    deadline = time.monotonic() + 2
+    while len(c) > 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(c) == 1 and c.expirations == 1
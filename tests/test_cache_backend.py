@@ -0,0 +1,81 @@
+import asyncio, time
+
+import httpx
+import pytest
+
+from api import cache_backend, http_sedapal
+from api.cache import TTLCache
+from api.cache_backend import MemoryBackend, SharedCache, SqliteBackend
+
+
+def test_sqlite_add_es_candado(tmp_path):
+    b = SqliteBackend(str(tmp_path / "c.db"))
+    assert b.add("k", b"a", 60) is True
+    assert b.add("k", b"b", 60) is False
+    assert b.get("k") == b"a"
+    b.set("v", b"x", -1)  # ya vencido: otro lo puede tomar
+    assert b.add("v", b"y", 60) is True
+    assert b.get("v") == b"y"
+
+
+def test_delete_if_respeta_al_nuevo_dueno(tmp_path):
+    for b in (MemoryBackend(), SqliteBackend(str(tmp_path / "c.db"))):
+        b.set("lock", b"otro", 60)
+        b.delete_if("lock", b"mio")
+        assert b.get("lock") == b"otro"
+        b.delete_if("lock", b"otro")
+        assert b.get("lock") is None
+
+
+def test_l2_llena_el_l1_de_otro_worker(tmp_path):
+    backend = SqliteBackend(str(tmp_path / "c.db"))
+    cache = lambda: SharedCache(TTLCache("t", maxsize=10, ttl=60), backend, "t:", bytes, bytes)
+    a, b = cache(), cache()
+    a.set(1, b"hola")
+    assert b.local.get(1) is None
+    assert b.get(1) == b"hola"
+    backend.delete("t:1")
+    assert b.get(1) == b"hola"  # ya quedó en el L1
+    assert b.get_shared(1) is None
+
+
+def test_backend_no_compartido_no_toca_el_l2():
+    backend = MemoryBackend()
+    c = SharedCache(TTLCache("t", maxsize=10, ttl=60), backend, "t:", bytes, bytes)
+    c.set(1, b"x")
+    assert backend.get("t:1") is None
+    assert asyncio.run(c.aget_shared(1)) is None
+
+
+def test_redis_sin_paquete_es_error_de_configuracion(monkeypatch):
+    monkeypatch.setattr(cache_backend, "redis", None)
+    with pytest.raises(ValueError, match="paquete redis"):
+        cache_backend.from_url("redis://127.0.0.1:6379/0")
+
+
+def test_redis_caido_no_tumba_el_pedido():
+    pytest.importorskip("redis")
+    b = cache_backend.from_url("redis://:clave@127.0.0.1:1/0")
+    assert b.get("k") is None
+    assert b.add("lock", b"yo", 60) is None  # quien espera el candado sigue de largo
+    b.delete_if("lock", b"yo")
+    assert b.errors == 3
+    assert "clave" not in b.stats()["url"]
+
+
+def test_refresh_no_borra_el_candado_ajeno(monkeypatch, sedapal_client):
+    backend = MemoryBackend()
+    monkeypatch.setattr(http_sedapal, "_CACHE_BACKEND", backend)
+    monkeypatch.setattr(http_sedapal._RECIBOS_CACHE, "shared", True)
+    monkeypatch.setattr(http_sedapal._RECIBOS_CACHE, "backend", backend)
+    c = sedapal_client(lambda req: httpx.Response(503))
+    lock = "sedapal:lock:recibos:1"
+
+    async def refresh(nis, last, hist):
+        # el nuestro venció a mitad del refresh y otro worker tomó el candado
+        backend.set(lock, b"otro", 60)
+        return http_sedapal._listing_entry([], time.time())
+
+    c._do_refresh = refresh
+    asyncio.run(c._refresh_recibos(1, None))
+    assert backend.get(lock) == b"otro"
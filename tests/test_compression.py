@@ -0,0 +1,56 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from api import app as app_module, http_sedapal
+from api.compression import base_etag, encoded_etag
+from api.recibo import Recibo
+
+
+def test_etag_por_encoding():
+    assert encoded_etag('"abc"', "br") == '"abc-br"'
+    assert encoded_etag('"abc"', None) == '"abc"'
+    assert encoded_etag('W/"abc"', "gzip") == 'W/"abc"'
+    assert base_etag('W/"abc-gzip"') == base_etag('"abc-br"') == '"abc"'
+
+
+def test_listado_etag_distinto_por_variante(monkeypatch):
+    items = [Recibo.from_upstream({"recibo": str(i), "f_fact": f"2024-01-{i + 1:02d}", "estado": "COBRADO",
+                                   "total_fact": "123.45", "mes": "Enero 2024"}) for i in range(30)]
+    entry = http_sedapal._listing_entry(items, time.time())
+
+    async def fetch(nis):
+        return entry
+
+    monkeypatch.setattr(app_module.client, "fetch_recibos_entry", fetch)
+    monkeypatch.setattr(app_module.client, "prefetch_pdfs", lambda *a, **k: None)
+    c = TestClient(app_module.app)
+    plano = c.get("/api/recibos/1", headers={"Accept-Encoding": "identity"})
+    gz = c.get("/api/recibos/1", headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["content-encoding"] == "gzip"
+    assert plano.headers["etag"] == entry["etag"]
+    assert gz.headers["etag"] == entry["etag"][:-1] + '-gzip"'
+    assert "content-encoding" not in plano.headers
+    assert gz.content == plano.content  # httpx ya descomprime
+
+    # cualquiera de las dos sirve para revalidar
+    for tag in (plano.headers["etag"], gz.headers["etag"]):
+        r = c.get("/api/recibos/1", headers={"Accept-Encoding": "gzip", "If-None-Match": tag})
+        assert r.status_code == 304
+        assert r.headers["etag"] == gz.headers["etag"]
+
+
+def test_304_no_serializa_ni_comprime(monkeypatch):
+    items = [Recibo.from_upstream({"recibo": "1", "f_fact": "2024-01-01", "estado": "COBRADO"})]
+    entry = http_sedapal._listing_entry(items, time.time())
+
+    async def fetch(nis):
+        return entry
+
+    monkeypatch.setattr(app_module.client, "fetch_recibos_entry", fetch)
+    monkeypatch.setattr(app_module.client, "prefetch_pdfs", lambda *a, **k: None)
+    r = TestClient(app_module.app).get("/api/recibos/1", headers={"Accept-Encoding": "gzip",
+                                                                 "If-None-Match": entry["etag"]})
+    assert r.status_code == 304
+    assert r.headers["etag"] == entry["etag"][:-1] + '-gzip"'
+    assert "_bodies" not in entry
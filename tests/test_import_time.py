@@ -0,0 +1,10 @@
+from bench import import_time
+
+
+def test_import_sedapal_liviano():
+    budget, forbid = import_time.BUDGETS["api.sedapal"]
+    total, own = import_time.measure("api.sedapal")
+    assert import_time.forbidden(list(own), forbid) == []
+    assert {"selenium", "encontrarpdf", "requests"} & set(own) == set()
+    # holgado: una máquina de CI lenta no debe fallar por ruido, pero sí si vuelve Selenium
+    assert total < budget * 3, f"import api.sedapal tardó {total:.0f} ms"
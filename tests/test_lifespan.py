@@ -0,0 +1,20 @@
+import os, subprocess, sys
+
+from fastapi.testclient import TestClient
+
+from api import app as app_module
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_sin_deprecaciones():
+    r = subprocess.run([sys.executable, "-W", "error::DeprecationWarning", "-c", "import api.app"],
+                       cwd=ROOT, capture_output=True, text=True)
+    assert r.returncode == 0, r.stderr
+
+
+def test_lifespan_arranca_y_cierra():
+    with TestClient(app_module.app) as c:
+        assert c.get("/api/test").status_code == 200
+        assert app_module.client.tokens._task is not None
+    assert app_module.client.s.is_closed
@@ -0,0 +1,21 @@
+import asyncio, time
+
+import httpx
+
+from api import http_sedapal
+from api.recibo import Recibo
+
+
+def test_html_de_mantenimiento_sirve_la_ultima_copia(sedapal_client):
+    viejo = time.time() - (http_sedapal.RECIBOS_TTL + http_sedapal.RECIBOS_STALE + 10)
+    items = [Recibo.from_upstream({"recibo": "1", "f_fact": "2024-01-01", "estado": "PENDIENTE"})]
+    http_sedapal._cache_listing(1, http_sedapal._listing_entry(items, viejo))
+    c = sedapal_client(lambda req: httpx.Response(200, text="<html>En mantenimiento</html>"))
+
+    entry = asyncio.run(c.fetch_recibos_entry(1))
+
+    assert [r.recibo for r in entry["items"]] == ["1"]
+    assert entry["revalidate_at"] > time.time()
+    assert c.stale_served == 1
+    # el 200 con HTML cuenta como fallo para el breaker
+    assert c.upstream.breaker("lista-recibos-pagados-nis").failures >= 1
@@ -0,0 +1,30 @@
+from api.metrics import Registry
+
+
+def _grupos(text: str):
+    """Nombres de métrica en orden de aparición, colapsando líneas consecutivas."""
+    out = []
+    for line in text.splitlines():
+        name = line.split()[2] if line.startswith("#") else line.split("{")[0].split()[0]
+        if not out or out[-1] != name:
+            out.append(name)
+    return out
+
+
+def test_colectores_agrupados_por_metrica():
+    reg = Registry()
+    reg.counter("x_total", "x").inc(endpoint="a")
+
+    @reg.collector
+    def _samples():
+        for ep in ("deudas", "pagados", "recibo-pdf"):
+            yield "up_limit", "gauge", "límite", {"endpoint": ep}, 8
+            yield "up_in_flight", "gauge", "en curso", {"endpoint": ep}, 1
+            yield "up_skip", "gauge", "sin valor", {"endpoint": ep}, None
+
+    text = reg.render()
+    grupos = _grupos(text)
+    assert len(grupos) == len(set(grupos)) == 3
+    assert text.count("# TYPE up_limit gauge") == 1
+    assert text.count('up_in_flight{endpoint="') == 3
+    assert "up_skip" not in text
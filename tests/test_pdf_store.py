@@ -0,0 +1,18 @@
+import os, time
+
+from api.pdf_store import PdfStore
+
+
+def test_evict_borra_el_indice_de_lo_desalojado(tmp_path):
+    store = PdfStore(str(tmp_path), max_bytes=10**9)
+    store.put("viejo", b"%PDF-1 " + b"a" * 1000)
+    store.put("otro", b"%PDF-1 " + b"a" * 1000)  # mismo contenido, mismo objeto
+    store.put("nuevo", b"%PDF-1 " + b"b" * 1000)
+    antes = time.time() - 3600
+    os.utime(store.object_path(store.digest("viejo")), (antes, antes))
+
+    store.max_bytes = 1500
+    assert store.evict() == 1
+    assert store.digest("viejo") is None and store.digest("otro") is None
+    assert store.read("nuevo").endswith(b"b")
+    assert len(os.listdir(store.index)) == 1
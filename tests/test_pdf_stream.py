@@ -0,0 +1,62 @@
+import base64, json
+
+import pytest
+
+from api.http_sedapal import _decode_pdf
+from api.pdf_stream import Base64PdfDecoder
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 20 + b"\n%%EOF\n"
+B64 = base64.b64encode(PDF).decode()
+
+
+def _run(body: bytes, size: int) -> bytes:
+    dec = Base64PdfDecoder(_decode_pdf)
+    out = [dec.feed(body[i:i + size]) for i in range(0, len(body), size)]
+    out.append(dec.finish())
+    return b"".join(out)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64, 1000, 1 << 20])
+def test_cortes_arbitrarios(size):
+    body = json.dumps({"bRESP": B64, "cRESP": "OK"}).encode()
+    assert _run(body, size) == PDF
+
+
+@pytest.mark.parametrize("size", [1, 3, 76, 1 << 20])
+def test_escapes_y_saltos_de_linea(size):
+    # SEDAPAL a veces manda "\/" y base64 partido en líneas
+    lines = "\n".join(B64[i:i + 76] for i in range(0, len(B64), 76))
+    body = json.dumps({"bresp": lines}).replace("/", "\\/").encode()
+    assert _run(body, size) == PDF
+
+
+@pytest.mark.parametrize("size", [1, 9, 1 << 20])
+def test_clave_vacia_cae_a_la_otra(size):
+    body = json.dumps({"bresp": "", "bRESP": B64}).encode()
+    assert _run(body, size) == PDF == _decode_pdf(json.loads(body))
+
+
+@pytest.mark.parametrize("payload", [{"bresp": "", "bRESP": ""}, {"bRESP": ""}, {"cRESP": "ERROR"}, None])
+def test_vacio_es_error(payload):
+    body = json.dumps(payload).encode()
+    for size in (1, 1 << 20):
+        with pytest.raises(RuntimeError):
+            _run(body, size)
+
+
+@pytest.mark.parametrize("payload", [{"bRESP": {"content": B64}}, {"bresp": "", "bRESP": {"content": B64}}])
+def test_valor_dict_usa_el_fallback(payload):
+    assert _run(json.dumps(payload).encode(), 5) == PDF
+
+
+def test_no_pdf_es_error():
+    with pytest.raises(RuntimeError):
+        _decode_pdf({"bRESP": base64.b64encode(b"<html>mantenimiento</html>").decode()})
+
+
+def test_respuesta_cortada():
+    body = json.dumps({"bRESP": B64}).encode()[:-10]
+    dec = Base64PdfDecoder(_decode_pdf)
+    dec.feed(body)
+    with pytest.raises(RuntimeError):
+        dec.finish()
@@ -0,0 +1,112 @@
+import asyncio, json, time
+
+import httpx
+
+from api import http_sedapal
+from api.recibos_store import ReciboStore
+
+DEUDA = {"recibo": "D1", "f_fact": "2024-03-01", "sec_rec": 3, "estado": "PENDIENTE"}
+PAGADO = {"recibo": "P1", "f_fact": "2024-01-01", "sec_rec": 1, "estado": "COBRADO"}
+
+
+def _vencer(c, nis: int):
+    # el historial queda viejo para RECIBOS_TTL pero dentro de FULL_SYNC_SECONDS
+    if c.store:
+        c.store._conn().execute("UPDATE sync SET synced_at = 0 WHERE nis = ?", (nis,))
+    else:
+        http_sedapal._HISTORY.get(nis)["synced_at"] = 0
+
+
+def test_save_sin_deudas_conserva_pendientes(tmp_path):
+    store = ReciboStore(str(tmp_path / "r.db"))
+    store.save(1, [DEUDA], [PAGADO], time.time(), http_sedapal._recibo_key)
+    store.save(1, None, [PAGADO], time.time(), http_sedapal._recibo_key)
+    assert [d["recibo"] for d in store.history(1, 30)["deudas"]] == ["D1"]
+    store.save(1, [], [PAGADO], time.time(), http_sedapal._recibo_key)
+    assert store.history(1, 30)["deudas"] == []
+
+
+def test_deudas_caida_no_borra_pendientes(sedapal_client):
+    def handler(req):
+        if req.url.path.endswith("deudas-nis"):
+            return httpx.Response(503)
+        page = json.loads(req.content)["page_num"]
+        return httpx.Response(200, json={"bRESP": [PAGADO] if page == 1 else []})
+
+    c = sedapal_client(handler)
+    # historial viejo (fuerza listado completo) con una deuda pendiente
+    c.store.save(1, [DEUDA], [], 0, http_sedapal._recibo_key)
+    _vencer(c, 1)
+
+    entry = asyncio.run(c._do_refresh(1, None, None))
+
+    assert [d["recibo"] for d in c.store.history(1, 30)["deudas"]] == ["D1"]
+    assert {r.recibo for r in entry["items"]} == {"D1", "P1"}
+    assert entry["revalidate_at"] <= time.time() + http_sedapal.STALE_RETRY
+
+
+def test_sin_sqlite_el_historial_en_memoria_habilita_delta(sedapal_client):
+    caida = {"deudas": False}
+
+    def handler(req):
+        if req.url.path.endswith("deudas-nis"):
+            return httpx.Response(503) if caida["deudas"] else httpx.Response(200, json={"bRESP": [DEUDA]})
+        page = json.loads(req.content)["page_num"]
+        return httpx.Response(200, json={"bRESP": [PAGADO] if page == 1 else []})
+
+    c = sedapal_client(handler)
+    c.store = None
+    deltas = []
+    delta = c._delta_listing
+
+    async def spy(n, hist):
+        deltas.append(n)
+        return await delta(n, hist)
+
+    c._delta_listing = spy
+
+    asyncio.run(c._do_refresh(1, None, None))
+    assert deltas == []
+    _vencer(c, 1)
+    caida["deudas"] = True
+    entry = asyncio.run(c._do_refresh(1, None, None))
+
+    assert deltas == [1]
+    assert sorted(r.recibo for r in entry["items"]) == ["D1", "P1"]
+    assert [d["recibo"] for d in http_sedapal._HISTORY.get(1)["deudas"]] == ["D1"]
+
+
+def _recien_pagado(sedapal_client, con_sqlite: bool):
+    r2 = {"recibo": "R2", "f_fact": "2024-02-01", "sec_rec": 2, "estado": "PENDIENTE"}
+    caida = {"deudas": False}
+
+    def handler(req):
+        if req.url.path.endswith("deudas-nis"):
+            return httpx.Response(503) if caida["deudas"] else httpx.Response(200, json={"bRESP": [r2]})
+        page = json.loads(req.content)["page_num"]
+        pagina = [dict(r2, estado="COBRADO"), PAGADO] if caida["deudas"] else [PAGADO]
+        return httpx.Response(200, json={"bRESP": pagina if page == 1 else []})
+
+    c = sedapal_client(handler)
+    if not con_sqlite:
+        c.store = None
+
+    asyncio.run(c._do_refresh(1, None, None))
+    _vencer(c, 1)
+    # deudas se cae justo cuando R2 pasó a pagados
+    caida["deudas"] = True
+    entry = asyncio.run(c._do_refresh(1, None, None))
+
+    estados = {r.recibo: r.estado for r in entry["items"]}
+    assert estados["R2"] == "COBRADO"
+    assert entry["revalidate_at"] <= time.time() + http_sedapal.STALE_RETRY
+    hist = c.store.history(1, 30) if con_sqlite else http_sedapal._HISTORY.get(1)
+    assert hist["deudas"] == []
+
+
+def test_delta_con_deudas_caida_respeta_recien_pagado(sedapal_client):
+    _recien_pagado(sedapal_client, con_sqlite=True)
+
+
+def test_delta_con_deudas_caida_respeta_recien_pagado_sin_sqlite(sedapal_client):
+    _recien_pagado(sedapal_client, con_sqlite=False)
@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api import http_sedapal
+from api.resilience import AIMDLimiter, CircuitBreaker, CircuitOpenError
+
+URL = f"{http_sedapal.BASE}/recibos/lista-recibos-deudas-nis"
+
+
+def _half_open(c) -> CircuitBreaker:
+    br = c.upstream.breaker("lista-recibos-deudas-nis")
+    br.reset = 0
+    for _ in range(br.max_failures):
+        br.failure()
+    assert br.state == "open"
+    return br
+
+
+def test_prueba_cancelada_en_cola_no_traba_el_breaker(sedapal_client):
+    c = sedapal_client(lambda req: httpx.Response(200, json={"bRESP": []}))
+
+    async def run():
+        br = _half_open(c)
+        lim = c.upstream.limiter("lista-recibos-deudas-nis")
+        lim.limit = 1
+        lim.in_flight = 1  # otro pedido ocupa el único lugar
+        task = asyncio.ensure_future(c._send(URL, {}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert br.failures == br.max_failures  # la cancelación no es un fallo
+        lim.in_flight = 0
+        await c._send(URL, {})
+        assert br.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_cancelado_en_vuelo_libera_sin_castigar(sedapal_client):
+    gate = asyncio.Event()
+
+    async def slow(req):
+        await gate.wait()
+        return httpx.Response(200, json={})
+
+    c = sedapal_client(slow)
+
+    async def run():
+        br = _half_open(c)
+        lim = c.upstream.limiter("lista-recibos-deudas-nis")
+        limit = lim.limit
+        task = asyncio.ensure_future(c._send(URL, {}))
+        await asyncio.sleep(0.01)
+        with pytest.raises(CircuitOpenError):
+            await c._send(URL, {})  # solo una prueba a la vez
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert lim.in_flight == 0 and lim.limit == limit and lim.drops == 0
+        gate.set()
+        await c._send(URL, {})
+        assert br.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_limitador_crece_y_se_parte():
+    async def run():
+        lim = AIMDLimiter("x", initial=4, target_latency=1)
+        for _ in range(4):
+            await lim.acquire()
+        await lim.release(0.1, True)
+        assert lim.limit > 4
+        await lim.release(0.1, False)
+        assert lim.limit < 4
+        await lim.release(0.1, None)
+        assert lim.in_flight == 1
+
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from api.singleflight import SingleFlight
+
+
+def test_resultado_compartido():
+    async def run():
+        sf, calls = SingleFlight(), []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "pdf"
+
+        out = await asyncio.gather(*(sf.do("k", fn) for _ in range(3)))
+        assert out == ["pdf"] * 3 and len(calls) == 1
+        assert sf.stats() == {"in_flight": 0, "leaders": 1, "shared": 2}
+
+    asyncio.run(run())
+
+
+def test_excepcion_compartida():
+    async def run():
+        sf = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("SEDAPAL caído")
+
+        out = await asyncio.gather(*(sf.do("k", fn) for _ in range(2)), return_exceptions=True)
+        assert [str(e) for e in out] == ["SEDAPAL caído"] * 2
+        assert not sf.in_flight("k")
+
+    asyncio.run(run())
+
+
+def test_lider_cancelado_no_corta_a_los_demas():
+    async def run():
+        sf = SingleFlight()
+        gate = asyncio.Event()
+
+        async def fn():
+            await gate.wait()
+            return "ok"
+
+        lider = asyncio.ensure_future(sf.do("k", fn))
+        await asyncio.sleep(0)
+        otro = asyncio.ensure_future(sf.do("k", fn))
+        await asyncio.sleep(0)
+        lider.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await lider
+        assert sf.in_flight("k")  # la ejecución sigue para el que espera
+        gate.set()
+        assert await otro == "ok"
+        assert not sf.in_flight("k")
+
+    asyncio.run(run())
+
+
+def test_lead_a_mano():
+    async def run():
+        sf = SingleFlight()
+        fut = sf.lead("k")
+        assert fut is not None and sf.lead("k") is None
+        fut.set_exception(RuntimeError("x"))  # nadie la espera: no debe quedar colgada
+        await asyncio.sleep(0)
+        assert not sf.in_flight("k")
+        fut = sf.lead("k")
+        fut.cancel()
+        await asyncio.sleep(0)
+        assert not sf.in_flight("k")
+
+    asyncio.run(run())
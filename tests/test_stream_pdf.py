@@ -0,0 +1,54 @@
+import asyncio, base64, os, threading
+
+import httpx
+import pytest
+
+from api import http_sedapal
+from api.pdf_store import PdfWriter
+
+PDF = b"%PDF-1.4\n" + os.urandom(5000) + b"\n%%EOF\n"
+KEY = http_sedapal._pdf_key(1, 1, 1, "2024-01-01")
+
+
+def _respuesta(body: bytes):
+    return lambda req: httpx.Response(200, content=body)
+
+
+async def _collect(c) -> bytes:
+    return b"".join([chunk async for chunk in c.stream_pdf(1, 1, 1, "2024-01-01")])
+
+
+def test_pdf_vacio_no_se_guarda(sedapal_client):
+    c = sedapal_client(_respuesta(b'{"bresp":"","bRESP":""}'))
+    with pytest.raises(RuntimeError):
+        asyncio.run(_collect(c))
+    assert os.listdir(c.pdf_store.objects) == []
+    assert c.pdf_store.path(KEY) is None
+
+
+def test_pdf_valido_se_guarda(sedapal_client):
+    c = sedapal_client(_respuesta(b'{"bresp":"","bRESP":"%s"}' % base64.b64encode(PDF)))
+    assert asyncio.run(_collect(c)) == PDF
+    assert c.pdf_store.read(KEY) == PDF
+
+
+def test_disco_fuera_del_event_loop(sedapal_client):
+    hilos = []
+
+    class Espia(PdfWriter):
+        def __init__(self, *a):
+            hilos.append(threading.current_thread())
+            super().__init__(*a)
+
+        def write(self, data):
+            hilos.append(threading.current_thread())
+            super().write(data)
+
+        def commit(self):
+            hilos.append(threading.current_thread())
+            return super().commit()
+
+    c = sedapal_client(_respuesta(b'{"bresp":"","bRESP":"%s"}' % base64.b64encode(PDF)))
+    c.pdf_store.writer = lambda k: Espia(c.pdf_store, k)
+    assert asyncio.run(_collect(c)) == PDF
+    assert len(hilos) >= 3 and threading.main_thread() not in hilos
@@ -0,0 +1,57 @@
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from api import http_sedapal
+
+
+class Resp:
+    def __init__(self, payload, status=200):
+        self.status_code = status
+        self.content = http_sedapal.jsonfast.dumps(payload)
+
+    def raise_for_status(self):
+        pass
+
+
+class Sesion:
+    """requests.Session falso: el login tarda, como en SEDAPAL."""
+
+    def __init__(self):
+        self.headers = {}
+        self.logins = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, **kw):
+        if url.endswith("/login"):
+            time.sleep(0.05)
+            with self._lock:
+                self.logins += 1
+            return Resp({"bRESP": {"token": f"token-{self.logins}"}})
+        if self.headers.get("Authorization") == "vencido":
+            return Resp({}, 401)
+        return Resp({"bRESP": []})
+
+
+def _client() -> http_sedapal.SedapalHTTP:
+    c = http_sedapal.SedapalHTTP()
+    c.s = Sesion()
+    c.user, c.password, c.login_app_auth = "u", "p", "app"
+    return c
+
+
+def test_hilos_comparten_un_solo_login():
+    c = _client()
+    url = f"{http_sedapal.BASE}/recibos/lista-recibos-deudas-nis"
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda n: c._list_generic(url, 1, n, 10), range(8)))
+    assert c.s.logins == 1
+
+
+def test_401_simultaneos_reloguean_una_vez():
+    c = _client()
+    c._set_token("vencido")
+    c.token_exp = http_sedapal.datetime.utcnow() + http_sedapal.timedelta(hours=1)
+    url = f"{http_sedapal.BASE}/recibos/lista-recibos-deudas-nis"
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda n: c._list_generic(url, 1, n, 10), range(8)))
+    assert c.s.logins == 1
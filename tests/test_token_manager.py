@@ -0,0 +1,100 @@
+import asyncio, threading, time
+
+import pytest
+
+from api.cache_backend import MemoryBackend
+from api.token_manager import TokenManager
+
+
+def _login(calls, pausa: float = 0.0):
+    async def login():
+        calls.append(1)
+        if pausa:
+            await asyncio.sleep(pausa)
+        return f"token-{len(calls)}", time.time() + 3600
+
+    return login
+
+
+def _compartido():
+    backend = MemoryBackend()
+    backend.shared = True
+    return backend
+
+
+@pytest.fixture(params=["archivo", "backend"])
+def workers(request, tmp_path):
+    """Fábrica de TokenManager que comparten el mismo archivo o el mismo backend."""
+    backend = _compartido()
+
+    def make(login):
+        if request.param == "archivo":
+            return TokenManager(login, path=str(tmp_path / "token.json"))
+        return TokenManager(login, path=None, shared=backend)
+
+    return make
+
+
+def test_segundo_worker_adopta_el_token(workers):
+    calls = []
+    a, b = workers(_login(calls)), workers(_login(calls))
+    ta = asyncio.run(a.get())
+    tb = asyncio.run(b.get())
+    assert ta == tb == "token-1"
+    assert a.logins + b.logins == 1 == len(calls)
+    assert b.adopted == 1
+
+
+def test_refresh_concurrente_un_solo_login():
+    calls = []
+    tm = TokenManager(_login(calls, pausa=0.05), path=None)
+
+    async def run():
+        return await asyncio.gather(*(tm.refresh(stale=None) for _ in range(5)))
+
+    assert set(asyncio.run(run())) == {"token-1"}
+    assert tm.logins == 1
+
+
+def test_workers_simultaneos_un_solo_login(workers):
+    calls = []
+    tms = [workers(_login(calls, pausa=0.2)) for _ in range(2)]
+    tokens = []
+    # cada worker con su propio event loop, como procesos distintos
+    hilos = [threading.Thread(target=lambda tm=tm: tokens.append(asyncio.run(tm.refresh(stale=None))))
+             for tm in tms]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert tokens == ["token-1", "token-1"]
+    assert len(calls) == 1
+    assert sum(tm.adopted for tm in tms) == 1
+
+
+def test_token_rechazado_no_se_adopta(workers):
+    calls = []
+    a, b = workers(_login(calls)), workers(_login(calls))
+    viejo = asyncio.run(a.get())
+    # SEDAPAL rechazó el token: b no puede adoptarlo, tiene que loguear
+    assert asyncio.run(b.refresh(stale=viejo)) == "token-2"
+    assert asyncio.run(a.refresh(stale=viejo)) == "token-2"
+    assert len(calls) == 2
+
+
+def test_run_renueva_antes_de_vencer(monkeypatch):
+    calls, esperas = [], []
+    tm = TokenManager(_login(calls), path=None, margin=300)
+    tm.token, tm.exp = "viejo", time.time() + 400
+
+    async def sleep(d):
+        esperas.append(d)
+        if len(esperas) > 1:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(tm._run())
+    assert 95 <= esperas[0] <= 100  # exp - margin
+    assert tm.token == "token-1"
+    assert 3290 <= esperas[1] <= 3300